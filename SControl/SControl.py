@@ -7,8 +7,11 @@ cryosar1/SControl/SControl.py
 
 Configures CryoSAR1 via FTDI MPSSE SPI digital slow-control
 
+Batch mode (-b) does not load Qt: it programs the configuration file plus overrides through slowcontrol.py, verifies the readback, and exits
+with status 1 if any field reads back incorrectly.
+
 Requires the packages:
- - pyqt5
+ - pyqt5 (not needed for batch mode)
  - python3-bitstring (via system package manager)
  - libusb (via system package manager)
  - pyftdi (see manual for installation and setup instructions)
@@ -16,16 +19,6 @@ Requires the packages:
 
 import sys
 import argparse
-from PyQt5 import QtWidgets,QtCore
-from PyQt5.QtWidgets import QApplication
-from pyftdi.ftdi import Ftdi
-import SControl_GUI
-
-
-if hasattr(QtCore.Qt, 'AA_EnableHighDpiScaling'):
-    QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
-if hasattr(QtCore.Qt, 'AA_UseHighDpiPixmaps'):
-    QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True)
 
 
 if __name__ == "__main__":
@@ -43,9 +36,25 @@ if __name__ == "__main__":
     args = parser.parse_args()
     # Launch application
     if args.listFTDI:
+        from pyftdi.ftdi import Ftdi
         Ftdi.show_devices()
         sys.exit()
+    elif args.batch:
+        import slowcontrol
+        sc = slowcontrol.slowcontrol(args.cfgFile, args.addr, args.noConnect)
+        mismatch = sc.apply(args.override or [], verify=False)
+        if mismatch:
+            print("Readback incorrect for fields "+", ".join(mismatch)+".  Is the chip powered on?", file=sys.stderr)
+            sys.exit(1)
+        sys.exit()
     else:
+        from PyQt5 import QtWidgets,QtCore
+        from PyQt5.QtWidgets import QApplication
+        import SControl_GUI
+        if hasattr(QtCore.Qt, 'AA_EnableHighDpiScaling'):
+            QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
+        if hasattr(QtCore.Qt, 'AA_UseHighDpiPixmaps'):
+            QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_UseHighDpiPixmaps, True)
         app = QApplication(sys.argv)
         window = SControl_GUI.SControl_GUI(args)
         window.show()
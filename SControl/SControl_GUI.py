@@ -14,9 +14,7 @@ Requires the packages:
  - pyftdi (see manual for installation and setup instructions)
 '''
 
-import sys
 import os
-import time
 import math
 from PyQt5 import QtCore, QtGui
 from PyQt5.QtCore import QTimer
@@ -67,10 +65,6 @@ class SControl_GUI(QMainWindow):
         compare = self.cfg.compare(returnBits)[0]
         if False in compare:
             self.showError("Readback incorrect!  Initial programming.  Is the chip powered on?")
-        if self.args.batch:
-            # Give time for settings to take effect and analog signals to settle.  Batch setting is typically used by other scripts to automate measurement.  The FTDI chip is reset and the chip is put into an unknown state each time this script is invoked, hence we want to wait for settings to take effect.
-            time.sleep(0.1) 
-            sys.exit()
         
 
     def showError(self, message):
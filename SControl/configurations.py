@@ -6,19 +6,17 @@ Nov 2022
 cryosar1/SControl/configurations.py
 
 Implements digital slow-control via INI-like configuration files.
-
-Requires the packages:
- - python3-bitstring (via system package manager)
 '''
 
 import os, sys
 import datetime
 import configparser
-from bitstring import BitArray
 
 
 
 class configurations:
+    SETTLE_DEFAULTS = {'bool': 0.001, 'int': 0.001, 'bitstring': 0.001, 'enum': 0.001, 'hidden': 0.0, 'none': 0.0}    # Settling time by field type, in seconds
+
     # Initializes the class from a INI-like configuration file.  The file must contain a category 'Default' with key 'order'.
     # 'order' is a comma separated list of other section names, which are called fields.  The order of comma-separated elements are MSB to LSB.
     #
@@ -33,71 +31,93 @@ class configurations:
     #   'none' (or any other type not listed) -> GUI: QLineEdit but cannot be edited
     # Label is a string that describes the field, purely for GUI purposes.
     # For type 'enum', there is an additional key 'options' which is a comma-separated string that list the enumerated values from the minimum index to the maximum index.
+    # Optional key 'settle' is the time in seconds for a change of the field to take effect and for analog signals to settle.  Defaults by type in SETTLE_DEFAULTS.
     #
     # Once a configurations class is initialized, only 'value' may be changed.
+    #
+    # The file is parsed once into per-field tables (width, bit offset, mask) and the values are held as one integer bitvector, MSB of the first field
+    # as the most significant bit.  configparser is only used again when writing to a file.
     def __init__(self, cfgFile):
         self.cfgFile = os.path.abspath(cfgFile)
         self.cfg = configparser.ConfigParser()
         self.cfg.read(self.cfgFile)
         self.order = self.cfg['Default']['order'].split(",")
-        self.__update()
-
-    # Update class attributes containing lists of configuration items.
-    # Useful for direct access in another class.
-    def __update(self):
-        self.fieldList, self.widthList, self.valueList, self.typeList, self.labelList = self.get()
+        self.__compile()
+
+    # Builds the field tables and the bitvector from the parsed file
+    def __compile(self):
+        self.fieldList = self.order
+        self.widthList = [self.cfg[field]['width'] for field in self.order]
+        self.typeList = [self.cfg[field]['type'] for field in self.order]
+        self.labelList = [self.cfg[field]['label'] for field in self.order]
+        self.settleList = [float(self.cfg[field].get('settle', self.SETTLE_DEFAULTS.get(fieldtype, self.SETTLE_DEFAULTS['none'])))
+                           for field, fieldtype in zip(self.order, self.typeList)]
+        self.index = {field: ptr for ptr, field in enumerate(self.order)}
+        self.widths = [int(width) for width in self.widthList]
+        self.length = sum(self.widths)
+        # Bit offset of the LSB of each field, counted from the LSB of the bitvector
+        self.shifts = []
+        ptr = self.length
+        for width in self.widths:
+            ptr = ptr - width
+            self.shifts.append(ptr)
+        self.masks = [((1 << width) - 1) << shift for width, shift in zip(self.widths, self.shifts)]
+        # Field index of each bit, counted from the LSB of the bitvector
+        self.fieldAt = [0]*self.length
+        for k, (width, shift) in enumerate(zip(self.widths, self.shifts)):
+            self.fieldAt[shift:(shift+width)] = [k]*width
+        self.valueList = [self.check(self.cfg[field]['value'], width) for field, width in zip(self.order, self.widths)]
+        self.state = int("".join(self.valueList), 2) if self.length > 0 else 0
 
     # Checks for input sanity.
     # Input: val (string of bits), width (int)
     # Output: val with zero padding to match width if sane, otherwise an exception is raised
     def check(self, val, width):
-        obj_uint = BitArray(bin=val).uint
-        obj_bin = BitArray(uint=obj_uint, length=width).bin
-        return obj_bin
+        obj_uint = int(val, 2)
+        if obj_uint >= (1 << width):
+            raise ValueError("Value "+val+" does not fit in "+str(width)+" bits.")
+        return format(obj_uint, "0"+str(width)+"b") if width > 0 else ""
 
     # Retrieves configurations.
     # Input: list of fields.  Or if no input, assumes all fields in order.
     # Return: lists fields,width,value,type,label.  List elements are of type strings.
     def get(self, fieldList=None):
         if fieldList is None:
-            fieldList = self.order
-        widthList = []
-        valueList = []
-        typeList = []
-        labelList = []
-        for field in fieldList:
-            widthList.append(self.cfg[field]['width'])
-            valueList.append(self.cfg[field]['value'])
-            typeList.append(self.cfg[field]['type'])
-            labelList.append(self.cfg[field]['label'])
-        return fieldList,widthList,valueList,typeList,labelList
+            return self.fieldList, list(self.widthList), list(self.valueList), list(self.typeList), list(self.labelList)
+        ptrs = [self.index[field] for field in fieldList]
+        return (fieldList, [self.widthList[ptr] for ptr in ptrs], [self.valueList[ptr] for ptr in ptrs],
+                [self.typeList[ptr] for ptr in ptrs], [self.labelList[ptr] for ptr in ptrs])
 
     # Sets a value to a field
     # Input: field and value to set for the field.  List elements are of type strings.
     # Return: none
     def set(self, field, value):
-        self.cfg[field]['value'] = self.check(value, int(self.cfg[field]['width']))
-        self.__update()
+        ptr = self.index[field]
+        value = self.check(value, self.widths[ptr])
+        self.valueList[ptr] = value
+        self.state = (self.state & ~self.masks[ptr]) | (int(value or "0", 2) << self.shifts[ptr])
 
     # Gets values for enumerated objects
     # Input: field name
     # Return: list of options from the least index to maximum index.  Empty list if not an enum type.
     def getEnum(self, field):
-        if self.cfg[field]['type'] == 'enum':
+        if self.typeList[self.index[field]] == 'enum':
             return self.cfg[field]['options'].split(",")
         else:
             return []
 
     # Returns a string of bits from MSB to LSB according to the order list
     def toBits(self):
-        valueList = []
-        for field in self.order:
-            valueList.append(self.cfg[field]['value'])
-        return "".join(valueList)
+        return format(self.state, "0"+str(self.length)+"b") if self.length > 0 else ""
+
+    # Converts a string of bits to a bitvector of the configuration length.  Missing bits are zero, extra bits are ignored.
+    def toInt(self, bits):
+        bits = bits[:self.length].ljust(self.length, "0")
+        return int(bits, 2) if self.length > 0 else 0
 
     # Gets number of bits in the class
     def len(self):
-        return len(self.toBits())
+        return self.length
 
     # Gets number of fields
     def numFields(self):
@@ -128,6 +148,8 @@ class configurations:
         if self.NewCfgFilepath == self.cfgFile:
             raise ValueError("Cannot overwrite cfg file that was used in class initialization!")
         else:
+            for field, value in zip(self.order, self.valueList):
+                self.cfg[field]['value'] = value
             with open(self.NewCfgFilepath, 'w') as newCfgFile:
                 now = datetime.datetime.now()
                 now = now.strftime('%Y-%m-%d %H:%M:%S')
@@ -135,28 +157,63 @@ class configurations:
                 newCfgFile.write("# YYYY-MM-DD HH:MM:SS = "+now+"\n")
                 self.cfg.write(newCfgFile)
 
+    # Finds the fields with set bits in a bitvector, e.g. the XOR of two configurations.  Takes one step per field with set bits.
+    # Input: x (int bitvector)
+    # Return: list of field indices, in order of the order list
+    def changed(self, x):
+        fields = []
+        while x:
+            k = self.fieldAt[x.bit_length() - 1]
+            fields.append(k)
+            x = x & ~self.masks[k]
+        return fields
+
+    # Time for changed fields to settle
+    # Input: x (int bitvector with the changed bits set, e.g. the XOR of the previous and new configuration)
+    # Return: largest settling time of the changed fields, in seconds
+    def settleTime(self, x):
+        return max([self.settleList[k] for k in self.changed(x)], default=0.0)
+
+    # Checks each field of a bitvector for set bits
+    # Input: x (int bitvector), length (number of bits the bitvector was made from, see toInt)
+    # Return: list of booleans corresponding to the order list.  True if no bit of the field is set and the field was fully present.
+    def match(self, x, length):
+        compareList = [True]*len(self.order)
+        for k in self.changed(x):
+            compareList[k] = False
+        # Fields cut short by the end of the bit string do not match
+        if length < self.length:
+            for k, shift in enumerate(self.shifts):
+                if self.length - shift > length:
+                    compareList[k] = False
+        # Last field: check if length of bits are same.  Set last boolean to false if not.
+        if length != self.length:
+            compareList[-1] = False
+        return compareList
+
+    # Compares two bit strings field by field
+    # Input: expected and inBits (strings of bits, MSB to LSB, in order of the order list)
+    # Return: list of fields whose bits differ.  The last field also differs if the length of inBits is not the configuration length.
+    def diff(self, expected, inBits):
+        compareList = self.match(self.toInt(expected) ^ self.toInt(inBits), len(inBits))
+        return [field for field, match in zip(self.order, compareList) if not match]
+
+    # Compares many pairs of bit strings field by field, e.g. a sequence of programmed configurations against their readbacks
+    # Each pair costs one XOR and one step per differing field, see changed().
+    # Input: expectedList and inBitsList (lists of strings of bits, MSB to LSB, in order of the order list)
+    # Return: list with one list of differing fields per pair.  The last field also differs if the length of inBits is not the configuration length.
+    def diffs(self, expectedList, inBitsList):
+        if len(expectedList) != len(inBitsList):
+            raise ValueError("Need one readback per configuration.")
+        return [self.diff(expected, inBits) for expected, inBits in zip(expectedList, inBitsList)]
+
     # Compares an input bit string against the current configuration
     # Input: string of bits
     # Return: 
     # (1) list of booleans corresponding to the order list.  True if values match, otherwise false.
     # (2) list of strings corresponding to the inBits separated by field
     def compare(self, inBits):
-        compareList = []
-        inBitsList = []
-        ptr = 0     # Position of the MSB currently being checked
-        for field in self.order:
-            width = int(self.cfg[field]['width'])
-            valueCfg = self.cfg[field]['value']
-            valueInBits = inBits[ptr:(ptr+width)]
-            ptr = ptr + width
-            inBitsList.append(valueInBits)
-            if valueCfg == valueInBits:
-                compareList.append(True)
-            else:
-                compareList.append(False)
-            # Last field: check if length of bits are same.  Set last boolean to false if not.
-            if (field == self.order[-1]) and (len(inBits) != self.len()):
-                compareList[-1] = False
+        compareList = self.match(self.toInt(inBits) ^ self.state, len(inBits))
+        inBitsList = [inBits[(self.length-shift-width):(self.length-shift)] for width, shift in zip(self.widths, self.shifts)]
         return compareList, inBitsList
 
-
@@ -19,6 +19,7 @@ from bitstring import BitArray
 class ftdispi:
     def __init__(self, addr=None, noConnect=False):
         self.noConnect = noConnect
+        self.register = None    # Emulated shift register contents in no-connect mode
         if addr is None:
             self.list()
             raise ValueError("Must connect to a FTDI device.")
@@ -58,6 +59,11 @@ class ftdispi:
             #bitsRead.reverse()
             return bitsRead.bin
         else:
-            return inStr
+            # Emulate the shift register: shift in the bits and return the bits that were there previously
+            if self.register is None:
+                self.register = "0"*len(inStr)
+            outStr = self.register[-len(inStr):].rjust(len(inStr), "0")
+            self.register = (self.register + inStr)[-len(self.register):]
+            return outStr
 
 
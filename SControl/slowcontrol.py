@@ -0,0 +1,156 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SControl/slowcontrol.py
+
+Headless slow-control.  Keeps one SPI handle open and programs configuration override sets in-process, with the same semantics as 'SControl.py -b -o ...':
+every call starts from the configuration file defaults, applies the overrides, programs, verifies the readback, and waits for the settings to settle.
+The wait is the longest settling time (key 'settle' in the configuration file, or a default by type) of the fields that changed since the last wait,
+so flipping a digital control bit does not wait as long as a bandgap trim.
+
+The shift register returns its previous contents, so programming and verifying one configuration takes two transactions.  For a sequence of
+configurations, the transaction that programs configuration k+1 already reads back configuration k: applySequence() programs N configurations in N+1
+transactions, and applyDeferred() does the same one configuration at a time, for loops that measure between configurations.
+
+Requires the packages:
+ - python3-bitstring (via system package manager)
+ - libusb (via system package manager)
+ - pyftdi (see manual for installation and setup instructions), unless another SPI backend is given
+'''
+
+import time
+import configurations
+
+class slowcontrol:
+    DEF_ADDR = 'ftdi://ftdi:232h:FT6X0PWN/1'
+
+    # Inputs: cfgFile (configuration file giving the defaults), addr (FTDI address), noConnect (boolean),
+    # spi (object with a query(bits) method to use instead of opening the FTDI device, e.g. simulator.simulator),
+    # settle (seconds to wait after programming, or None to wait for the fields that changed)
+    def __init__(self, cfgFile, addr=DEF_ADDR, noConnect=False, spi=None, settle=None):
+        self.cfg = configurations.configurations(cfgFile)
+        self.defaults = list(self.cfg.valueList)
+        self.settle = settle
+        if spi is None:
+            import ftdispi
+            spi = ftdispi.ftdispi(addr, noConnect)
+        self.spi = spi
+        # Flush shift register.  Program in a bit string of length that is equal to or greater than the shift register size.  Discard the output.
+        self.spi.query("0"*self.cfg.len())
+        # Bits programmed by the last transaction that have not been read back yet
+        self.pending = None
+        # Bitvector in the shift register, and bits changed since the last wait.  The state before the flush is unknown, so everything has changed.
+        self.chip = 0
+        self.changes = (1 << self.cfg.len()) - 1
+
+    # Sets the configuration file defaults plus overrides, without programming
+    # Input: list of '<field name>,<value>' strings, where value is a bit string MSB...LSB
+    def configure(self, overrides):
+        # Restore defaults
+        for field, default, value in zip(self.cfg.fieldList, self.defaults, self.cfg.valueList):
+            if value != default:
+                self.cfg.set(field, default)
+        # Parse overridden configurations.  Note the field name cannot have a comma.
+        for o in overrides:
+            field, value = o.split(",")[0:2]
+            if field not in self.cfg.order:
+                raise ValueError("Unknown field "+field+".")
+            self.cfg.set(field, value)
+
+    # Programs the configuration file defaults plus overrides, and verifies the readback
+    # Input: list of '<field name>,<value>' strings, where value is a bit string MSB...LSB.  verify (boolean, raise IOError on a readback mismatch)
+    # Return: list of fields whose readback differs
+    def apply(self, overrides, verify=True):
+        self.configure(overrides)
+        return self.program(verify)
+
+    # Programs the current configuration and verifies the readback
+    # Input: verify (boolean, raise IOError on a readback mismatch)
+    # Return: list of fields whose readback differs
+    def program(self, verify=True):
+        # A 'query' is a full-duplex, atomic transaction.  It programs in the bits and reads back the bits that were there previously.
+        # The second query programs the same bits and reads back the bits from the first query.
+        bits = self.cfg.toBits()
+        previous = self.shift(bits)
+        mismatch = self.shift(bits)
+        self.pending = None
+        if verify and previous:
+            raise IOError("Readback incorrect for fields "+", ".join(previous)+" of the previous configuration.  Is the chip powered on?")
+        if verify and mismatch:
+            raise IOError("Readback incorrect for fields "+", ".join(mismatch)+".  Is the chip powered on?")
+        self.wait()
+        return mismatch
+
+    # Programs the configuration file defaults plus overrides with a single transaction.  Its readback verifies the configuration of the previous
+    # applyDeferred() call, so a mismatch is reported one call late.  Call finish() after the last configuration.
+    # Input: list of '<field name>,<value>' strings.  verify (boolean, raise IOError on a readback mismatch)
+    # Return: list of fields of the previous configuration whose readback differs
+    def applyDeferred(self, overrides, verify=True):
+        self.configure(overrides)
+        mismatch = self.shift(self.cfg.toBits()) or []
+        if verify and mismatch:
+            raise IOError("Readback incorrect for fields "+", ".join(mismatch)+" of the previous configuration.  Is the chip powered on?")
+        self.wait()
+        return mismatch
+
+    # Reads back and verifies the last configuration of applyDeferred() by programming it again
+    # Input: verify (boolean, raise IOError on a readback mismatch)
+    # Return: list of fields whose readback differs
+    def finish(self, verify=True):
+        if self.pending is None:
+            return []
+        mismatch = self.shift(self.pending)
+        self.pending = None
+        if verify and mismatch:
+            raise IOError("Readback incorrect for fields "+", ".join(mismatch)+".  Is the chip powered on?")
+        return mismatch
+
+    # Programs a sequence of configurations back to back in N+1 transactions, each one verified by the readback of the next transaction.
+    # Intermediate configurations are not given time to settle.
+    # Input: list of override lists (see apply).  verify (boolean, raise IOError on a readback mismatch)
+    # Return: list with one list of mismatching fields per configuration
+    def applySequence(self, overrideSets, verify=True):
+        self.finish(verify)
+        programmed = []
+        readbacks = []
+        for overrides in overrideSets:
+            self.configure(overrides)
+            programmed.append(self.cfg.toBits())
+            readbacks.append(self.query(programmed[-1]))
+        if programmed:
+            # Last transaction: program the last configuration again to read it back
+            readbacks.append(self.query(programmed[-1]))
+        # Configuration k is read back by transaction k+1.  Check the whole sequence at once.
+        mismatches = self.cfg.diffs(programmed, readbacks[1:])
+        if verify and any(mismatches):
+            raise IOError("Readback incorrect for "+"; ".join(["step "+str(k)+": "+", ".join(m) for k, m in enumerate(mismatches) if m])+".  Is the chip powered on?")
+        self.wait()
+        return mismatches
+
+    # Waits for the fields changed since the last wait to settle
+    # Return: time waited, in seconds
+    def wait(self):
+        settle = self.settle if self.settle is not None else self.cfg.settleTime(self.changes)
+        self.changes = 0
+        time.sleep(settle)
+        return settle
+
+    # One transaction.  Keeps track of the bits changed since the last wait.
+    # Input: bits (string of bits, MSB to LSB)
+    # Return: bits shifted out
+    def query(self, bits):
+        x = self.cfg.toInt(bits)
+        self.changes = self.changes | (x ^ self.chip)
+        self.chip = x
+        return self.spi.query(bits)
+
+    # One transaction: programs bits and compares the bits shifted out against the bits of the previous transaction
+    # Input: bits (string of bits, MSB to LSB)
+    # Return: list of fields of the previous transaction whose readback differs, or None if the previous transaction was not recorded
+    def shift(self, bits):
+        returnBits = self.query(bits)
+        mismatch = None if self.pending is None else self.cfg.diff(self.pending, returnBits)
+        self.pending = bits
+        return mismatch
@@ -14,7 +14,6 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 import numpy as np
-import subprocess
 import tabulate
 import time
 import sys
@@ -24,6 +23,8 @@ import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
 import fpga
 import calibration
+sys.path.append("./../SControl")
+import slowcontrol
 
 from plotFFT import plotFFT
 
@@ -31,7 +32,8 @@ from plotFFT import plotFFT
 
 if __name__ == "__main__":
     fpga = fpga.fpga()
-    cal = calibration.calibration(fpga)
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
+    cal = calibration.calibration(fpga, sc)
     
     # Uncomment here to run calibration
     
@@ -52,10 +54,7 @@ if __name__ == "__main__":
     ## Calibrated data ##
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.odac,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.odac])
     except Exception as e:
         sys.exit(e)
     # Take data
@@ -78,10 +77,7 @@ if __name__ == "__main__":
     ## Uncalibrated data ##
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.CAL_ODAC_DEFAULT,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.CAL_ODAC_DEFAULT])
     except Exception as e:
         sys.exit(e)
     # Take data
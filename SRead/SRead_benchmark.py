@@ -0,0 +1,179 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/SRead_benchmark.py
+
+Acquisition-path benchmark.  Runs against the behavioral simulator, a replayed FrontPanel trace, or the hardware, and reports samples/s and latency
+percentiles for each stage of a capture:
+    wire (reset and start wire-ins), fill (waiting for the FIFO reset and fill), transfer (FIFO to host), decode (weighting), validity (valid bit check),
+    archive (raw word write)
+plus end-to-end takeData throughput for every combination of capture size and mult.
+
+Results are written as JSON (-o) so runs can be compared.  To benchmark against real silicon data offline, record a run on hardware with
+'-b hw --record session.trc' and replay it later with '-b replay --replay session.trc' and the same sizes, mults, repeats, and transfer mode.
+'''
+
+
+
+
+import os
+import sys
+import time
+import json
+import platform
+import datetime
+import tempfile
+import argparse
+import numpy as np
+import fpga
+import archive
+import fptrace
+
+STAGES = ["wire", "fill", "transfer", "decode", "validity", "archive"]
+DEF_SIZES = [1, 16, 256, 4096, 32768]
+DEF_MULTS = [1, 4, 16, 64]
+PERCENTILES = [50, 90, 99]
+
+
+# Latency statistics of a list of durations
+# Input: times (list of durations in seconds), samples (number of samples processed per duration)
+# Return: dictionary of repeats, mean, min, max, p50, p90, p99 (seconds) and samples_per_s (based on the mean)
+def summarize(times, samples):
+    times = np.asarray(times, dtype=float)
+    result = {"repeats": len(times), "mean": float(np.mean(times)), "min": float(np.min(times)), "max": float(np.max(times))}
+    for p in PERCENTILES:
+        result["p"+str(p)] = float(np.percentile(times, p))
+    if result["mean"] > 0:
+        result["samples_per_s"] = samples/result["mean"]
+    else:
+        result["samples_per_s"] = None
+    return result
+
+# Times each stage of single-batch captures
+# Input: fpga (fpga instance), arc (archive open for writing), source, numSamples, weights (list of 16, or None for radix-2), bipolar, repeats
+# Return: dictionary of stage name to summarize() result
+def benchStages(fpga, arc, source, numSamples, weights, bipolar, repeats):
+    spans = {stage: [] for stage in STAGES}
+    nInvalid = 0
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        fpga.command(source, False)
+        t1 = time.perf_counter()
+        fpga.waitReset()
+        t2 = time.perf_counter()
+        fpga.command(source, True)
+        t3 = time.perf_counter()
+        fpga.waitFill(numSamples)
+        t4 = time.perf_counter()
+        words = fpga.transfer(numSamples)
+        t5 = time.perf_counter()
+        fpga.parse(words, weights, bipolar)
+        t6 = time.perf_counter()
+        # Valid bit check on the raw words, as in fpga.reduceBatch
+        if source == "data":
+            nInvalid = nInvalid + len(words) - int(np.count_nonzero(words & 0x8000))
+        t7 = time.perf_counter()
+        arc.append(words, numSamples)
+        t8 = time.perf_counter()
+        spans["wire"].append((t1-t0) + (t3-t2))
+        spans["fill"].append((t2-t1) + (t4-t3))
+        spans["transfer"].append(t5-t4)
+        spans["decode"].append(t6-t5)
+        spans["validity"].append(t7-t6)
+        spans["archive"].append(t8-t7)
+    if nInvalid > 0:
+        print("Non-valid samples in the stage benchmark: %i words." % nInvalid)
+    return {stage: summarize(spans[stage], numSamples) for stage in STAGES}
+
+# Times complete takeData calls
+# Input: fpga, source, numSamples, mult, weights, bipolar, repeats, pipelined (see fpga.takeData)
+# Return: summarize() result
+def benchTakeData(fpga, source, numSamples, mult, weights, bipolar, repeats, pipelined):
+    out = fpga.allocate(numSamples*mult, None if source != "data" else weights)
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fpga.takeData(source, numSamples, weights, bipolar, mult=mult, out=out, pipelined=pipelined, progress="none")
+        times.append(time.perf_counter() - start)
+    return summarize(times, numSamples*mult)
+
+# Prints a table of samples/s and median latency
+def printResults(results):
+    print("Stage       Samples  Samples/s       p50 [us]    p99 [us]")
+    for entry in results["stages"]:
+        for stage in STAGES:
+            r = entry[stage]
+            print("%-10s  %7i  %14.1f  %10.1f  %10.1f" % (stage, entry["numSamples"], r["samples_per_s"] or 0, r["p50"]*1e6, r["p99"]*1e6))
+    print("takeData    Samples  Mult  Samples/s       p50 [ms]    p99 [ms]")
+    for entry in results["takeData"]:
+        print("%-10s  %7i  %4i  %14.1f  %10.3f  %10.3f" % ("", entry["numSamples"], entry["mult"], entry["samples_per_s"] or 0, entry["p50"]*1e3, entry["p99"]*1e3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the acquisition path stage by stage.')
+    parser.add_argument('-b', dest='backend', choices=["sim", "replay", "hw"], default="sim", help="FrontPanel backend.  (Default: sim)")
+    parser.add_argument('--replay', dest='replay', default=None, help="Trace to replay with '-b replay'")
+    parser.add_argument('--realtime', dest='realtime', action='store_true', default=False, help="Replay at the recorded timing, or fill the simulated FIFO at the real sample rate")
+    parser.add_argument('--record', dest='record', default=None, help="Record the FrontPanel calls of this run to a trace")
+    parser.add_argument('-t', dest='transfer', choices=["register", "pipe", "blockpipe"], default="pipe", help="Transfer mode.  (Default: pipe)")
+    parser.add_argument('-d', dest='fillDetect', choices=["sleep", "poll"], default="poll", help="FIFO fill detection.  (Default: poll)")
+    parser.add_argument('-e', dest='executor', choices=["auto", "inline", "thread", "process", "shm"], default="auto", help="Parsing executor.  (Default: auto)")
+    parser.add_argument('-s', dest='source', choices=["data", "frame", "fpgacounter"], default="data", help="Data source.  (Default: data)")
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=DEF_SIZES, help="Capture sizes in samples, 1...32768.  (Default: "+" ".join(map(str, DEF_SIZES))+")")
+    parser.add_argument('--mults', dest='mults', type=int, nargs='+', default=DEF_MULTS, help="Multiplicities of the end-to-end takeData runs.  (Default: "+" ".join(map(str, DEF_MULTS))+")")
+    parser.add_argument('-n', dest='repeats', type=int, default=20, help="Repeats per stage benchmark.  (Default: 20)")
+    parser.add_argument('-m', dest='repeatsTakeData', type=int, default=3, help="Repeats per takeData benchmark.  (Default: 3)")
+    parser.add_argument('-p', dest='pipelined', action='store_true', default=False, help="Use pipelined takeData")
+    parser.add_argument('-o', dest='output', default=None, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    # Backend
+    if args.backend == "sim":
+        import simulator
+        xem = simulator.simulator(realtime=args.realtime, seed=0)
+    elif args.backend == "replay":
+        if args.replay is None:
+            sys.exit("'-b replay' requires --replay.")
+        xem = fptrace.replayer(args.replay, realtime=args.realtime)
+    else:
+        import ok
+        xem = ok.FrontPanel()
+    if args.record is not None:
+        xem = fptrace.recorder(xem, args.record)
+    fpga = fpga.fpga(transfer=args.transfer, fillDetect=args.fillDetect, executor=args.executor, xem=xem)
+    weights = fpga.DEF_WEIGHTS if args.source == "data" else None
+
+    results = {
+        "timestamp": datetime.datetime.now().strftime('%Y%m%d_T%H%M%S'),
+        "backend": args.backend,
+        "transfer": args.transfer,
+        "fillDetect": args.fillDetect,
+        "executor": args.executor,
+        "source": args.source,
+        "pipelined": args.pipelined,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "stages": [],
+        "takeData": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp, fpga:
+        with archive.archive(os.path.join(tmp, "bench"), "w", source=args.source, weights=weights) as arc:
+            for numSamples in args.sizes:
+                entry = {"numSamples": numSamples}
+                entry.update(benchStages(fpga, arc, args.source, numSamples, weights, False, args.repeats))
+                results["stages"].append(entry)
+        for numSamples in args.sizes:
+            for mult in args.mults:
+                entry = {"numSamples": numSamples, "mult": mult}
+                entry.update(benchTakeData(fpga, args.source, numSamples, mult, weights, False, args.repeatsTakeData, args.pipelined))
+                results["takeData"].append(entry)
+    if args.record is not None:
+        xem.close()
+
+    printResults(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
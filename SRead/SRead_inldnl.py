@@ -14,7 +14,6 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 import numpy as np
-import subprocess
 import tabulate
 import datetime
 import time
@@ -25,15 +24,20 @@ import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
 import fpga
 import calibration
+sys.path.append("./../SControl")
+import slowcontrol
 import logger
+import archive
 
 from plotFFT import plotFFT
+from calcINLDNL import calcINLDNL
 
 
 
 if __name__ == "__main__":
     fpga = fpga.fpga()
-    cal = calibration.calibration(fpga)
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
+    cal = calibration.calibration(fpga, sc)
     sys.stdout = logger.logger("./output/inldnl/log.txt")
     # Save calibration info ##
     f = open("./output/inldnl/calibration.txt", "w") 
@@ -97,15 +101,12 @@ if __name__ == "__main__":
     RedundancyFactor = 2.0    # Combine this many LSB's together.  This divides the effective code space.
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.odac,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.odac])
     except Exception as e:
         sys.exit(e)
     # Take data
     cal.weights = np.array(cal.weights)/RedundancyFactor
-    data, valid, datar2 = fpga.takeData("data", bipolar=False, printBinary=False, weighting=cal.weights, mult=nMult)
+    data, valid, datar2 = fpga.takeData("data", bipolar=False, printBinary=False, weighting=cal.weights, mult=nMult, pipelined=True, invalid="retry")
     #data = np.array(data)/RedundancyFactor
     data = np.round(data)
     # Plot time domain
@@ -123,28 +124,13 @@ if __name__ == "__main__":
     #plotFFT(data, fpga.SER_RATE/8, showNow=False, title="Calibrated", save="./output/sine/FFT_cal")
     # Save data
     np.savetxt("./output/inldnl/data_cal.txt.gz", data)
-    np.savetxt("./output/inldnl/data_rad2.txt.gz", datar2)
+    with archive.archive("./output/inldnl/data_raw", "w", source="data", weights=cal.weights, bipolar=False, odac=cal.odac,
+            config=["ODAC_CODE,"+cal.odac], mult=nMult, numSamples=fpga.FIFO_MAXDEPTH, redundancyFactor=RedundancyFactor) as arc:
+        arc.append(datar2, batchLength=fpga.FIFO_MAXDEPTH)
 
-    ## Calculate DNL then INL
-    # Histogram
-    N = np.log2(np.max(data)-np.min(data))
-    hist, bin_edges = np.histogram(data, bins = np.arange(np.min(data), np.max(data), 1), density=True)
-    bin_edges = bin_edges[:-1]
-    
-    ## A different way of calculating INL, using best fit method from sine wave
-    # https://gitlab.cern.ch/jgonski/colutaanalysis/-/blob/dev_kiryeong/cv4_analysis/plotting/plots_slow_sine.py
-    # https://www3.advantest.com/documents/11348/27fd03db-3c5d-49e7-afb9-e0bcb6861cee
-    A = (np.max(data)-np.min(data))/2
+    ## Calculate DNL then INL, using best fit method from sine wave
+    bin_edges, dnl, inl, hist = calcINLDNL(data)
     print(np.sum(hist))
-    M = np.sum(hist)   # This needs to equal unity
-    sum_Hk = np.cumsum(hist)    # Cumulative distribution function
-    # Back-calculate the probability distribution function to obtain the transition locations
-    V_j = -A*np.cos((np.pi/M)*sum_Hk)
-    # Calculate DNL
-    dnl = np.diff(V_j) - 1
-    # Perform best line of fit, for use in INL
-    V_fit = np.poly1d(np.polyfit(bin_edges, V_j, 1))
-    inl = V_j - V_fit(bin_edges)
     
     
     # Plot INL/DNL
@@ -16,7 +16,6 @@ Use this script to take pedestal data.
 import ok
 import time
 import numpy as np
-import subprocess
 import tabulate
 import time
 import sys
@@ -26,12 +25,15 @@ import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
 import fpga
 import calibration
+sys.path.append("./../SControl")
+import slowcontrol
 
 
 
 if __name__ == "__main__":
     fpga = fpga.fpga()
-    cal = calibration.calibration(fpga)
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
+    cal = calibration.calibration(fpga, sc)
     
     # Uncomment here to run calibration
     '''
@@ -51,16 +53,13 @@ if __name__ == "__main__":
 
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.odac,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.odac])
     except Exception as e:
         sys.exit(e)
     # Take a pedestal
     data, valid = fpga.takeData("data", bipolar=False, printBinary=False, weighting=cal.weights, mult=1)
     # Round
-    data = [round(i) for i in data] 
+    data = np.round(data)
     #print(np.unique(data))
     print("Std dev: "+str(np.std(data)))
     # Plot histogram
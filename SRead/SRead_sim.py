@@ -0,0 +1,56 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/SRead_sim.py
+
+Runs calibration and a sine wave capture against the behavioral simulator.  No hardware or FrontPanel library needed.
+'''
+
+
+
+
+import time
+import argparse
+import matplotlib.pyplot as plt     # DNF: python3-matplotlib
+import fpga
+import calibration
+import simulator
+
+from plotFFT import plotFFT
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CryoSAR1 calibration and capture against the behavioral simulator.')
+    parser.add_argument('-n', dest='noise', type=float, default=0.5, help="Comparator noise in LSB.  (Default: 0.5)")
+    parser.add_argument('-s', dest='seed', type=int, default=None, help="Random seed")
+    parser.add_argument('-f', dest='fast', action='store_true', default=False, help="Fill the FIFO instantly instead of at the real sample rate")
+    parser.add_argument('-p', dest='plot', action='store_true', default=False, help="Show plots")
+    args = parser.parse_args()
+
+    sim = simulator.simulator(noise=args.noise, seed=args.seed, realtime=not args.fast)
+    fpga = fpga.fpga(transfer="pipe", fillDetect="poll", xem=sim)
+    cal = calibration.calibration(fpga)
+
+    # Calibrate
+    start = time.perf_counter()
+    sim.signal = "dc"
+    cal.calibrate_ODAC_using_weights_v2()
+    cal.calibrate_weights()
+    print("Calibration time [s]: "+str(time.perf_counter()-start))
+    print("True P-DAC weight:")
+    print("["+', '.join([f'{item:.8f}' for item in sim.weightsP])+"]")
+
+    # Take data
+    sim.signal = "sine"
+    sim.applyOverrides(["ODAC_CODE,"+cal.odac])
+    data, valid, datar2 = fpga.takeData("data", bipolar=False, printBinary=False, weighting=cal.weights, mult=1)
+    ENOB, SNDR, SFDR, SNR, SDR = plotFFT(data, fpga.SER_RATE/8, plot=args.plot, showNow=False, title="Calibrated")[0:5]
+    print("Calibrated ENOB: "+str(ENOB))
+    data, valid, datar2 = fpga.takeData("data", bipolar=False, printBinary=False, weighting=cal.CAL_WEIGHTS_DEFAULT.copy(), mult=1)
+    ENOB, SNDR, SFDR, SNR, SDR = plotFFT(data, fpga.SER_RATE/8, plot=args.plot, showNow=False, title="UNCalibrated")[0:5]
+    print("Uncalibrated ENOB: "+str(ENOB))
+    if args.plot:
+        plt.show()
@@ -14,7 +14,6 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 import numpy as np
-import subprocess
 import tabulate
 import datetime
 import time
@@ -25,7 +24,10 @@ import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
 import fpga
 import calibration
+sys.path.append("./../SControl")
+import slowcontrol
 import logger
+import archive
 
 from plotFFT import plotFFT
 
@@ -33,7 +35,8 @@ from plotFFT import plotFFT
 
 if __name__ == "__main__":
     fpga = fpga.fpga()
-    cal = calibration.calibration(fpga)
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
+    cal = calibration.calibration(fpga, sc)
     sys.stdout = logger.logger("./output/sine/log.txt")
     # Save calibration info ##
     f = open("./output/sine/calibration.txt", "w") 
@@ -85,10 +88,7 @@ if __name__ == "__main__":
     ## Calibrated data ##
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.odac,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.odac])
     except Exception as e:
         sys.exit(e)
     # Take data
@@ -107,16 +107,15 @@ if __name__ == "__main__":
     plotFFT(data, fpga.SER_RATE/8, showNow=False, title="Calibrated", save="./output/sine/FFT_cal")
     # Save data
     np.savetxt("./output/sine/data_cal.txt", data)
-    np.savetxt("./output/sine/data_rad2.txt", datar2)
+    with archive.archive("./output/sine/data_raw", "w", source="data", weights=cal.weights, bipolar=False, odac=cal.odac,
+            config=["ODAC_CODE,"+cal.odac], mult=1, numSamples=fpga.FIFO_MAXDEPTH) as arc:
+        arc.append(datar2, batchLength=fpga.FIFO_MAXDEPTH)
 
 
     ## Uncalibrated data ##
     # Apply data taking configuration + ODAC calibration
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "ODAC_CODE,"+cal.CAL_ODAC_DEFAULT,
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["ODAC_CODE,"+cal.CAL_ODAC_DEFAULT])
     except Exception as e:
         sys.exit(e)
     # Take data
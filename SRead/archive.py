@@ -0,0 +1,125 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/archive.py
+
+Raw capture archive.  Stores the raw 16-bit FIFO words of a capture together with the metadata needed to re-weight them later.
+
+An archive with base path <path> is made of three files:
+ - <path>.raw: FIFO words, uint16 little-endian, appended in capture order
+ - <path>.idx: start offset (in words) of each batch, uint64 little-endian, appended with the words
+ - <path>.json: metadata (source, weights, bipolar, ODAC, config overrides, timestamp, mult, numSamples, plus any extra keys)
+Both binary files are append-only, so long captures can be written batch by batch.  Reads are memory-mapped.
+'''
+
+import os
+import json
+import datetime
+import numpy as np
+
+class archive:
+    VERSION = 1
+    EXT_DATA = ".raw"
+    EXT_INDEX = ".idx"
+    EXT_META = ".json"
+    DTYPE_DATA = np.dtype('<u2')
+    DTYPE_INDEX = np.dtype('<u8')
+
+    # Opens an archive
+    # Input: path (base path, without extension), mode ('r' read, 'w' create or overwrite, 'a' append to an existing archive),
+    # metadata keywords (only in mode 'w'): source, weights, bipolar, odac, config, mult, numSamples, and any other JSON-serializable values
+    def __init__(self, path, mode="r", **metadata):
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        self.dataFile = None
+        self.indexFile = None
+        if mode == "w":
+            self.metadata = {
+                "version": self.VERSION,
+                "timestamp": datetime.datetime.now().strftime('%Y%m%d_T%H%M%S'),
+                "source": "data",
+                "weights": None,
+                "bipolar": False,
+                "odac": None,
+                "config": [],
+                "mult": None,
+                "numSamples": None,
+            }
+            for key, value in metadata.items():
+                if isinstance(value, np.ndarray):
+                    value = value.tolist()
+                self.metadata[key] = value
+            self.writeMetadata()
+            self.dataFile = open(self.path+self.EXT_DATA, "wb")
+            self.indexFile = open(self.path+self.EXT_INDEX, "wb")
+        elif mode in ("r", "a"):
+            if metadata:
+                raise ValueError("Metadata can only be given when creating an archive.")
+            with open(self.path+self.EXT_META, "r") as f:
+                self.metadata = json.load(f)
+            if mode == "a":
+                self.dataFile = open(self.path+self.EXT_DATA, "ab")
+                self.indexFile = open(self.path+self.EXT_INDEX, "ab")
+        else:
+            raise ValueError("Invalid archive mode.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.dataFile is not None:
+            self.dataFile.close()
+            self.indexFile.close()
+            self.dataFile = None
+            self.indexFile = None
+
+    # Writes the metadata file
+    def writeMetadata(self):
+        with open(self.path+self.EXT_META, "w") as f:
+            json.dump(self.metadata, f, indent=1)
+
+    # Appends FIFO words
+    # Input: words (array of FIFO words, only the lower 16 bits are kept), batchLength (number of words per batch, or None if all words are one batch)
+    def append(self, words, batchLength=None):
+        if self.dataFile is None:
+            raise ValueError("Archive is not open for writing.")
+        words = np.asarray(words)
+        if batchLength is None:
+            batchLength = max(len(words), 1)
+        start = self.dataFile.tell()//self.DTYPE_DATA.itemsize
+        offsets = np.arange(start, start+len(words), batchLength, dtype=self.DTYPE_INDEX)
+        (words & 0xFFFF).astype(self.DTYPE_DATA).tofile(self.dataFile)
+        offsets.tofile(self.indexFile)
+        self.dataFile.flush()
+        self.indexFile.flush()
+
+    # Returns all FIFO words as a read-only memory-mapped numpy array of uint16
+    def words(self):
+        if self.dataFile is not None:
+            self.dataFile.flush()
+        if os.path.getsize(self.path+self.EXT_DATA) == 0:
+            return np.empty(0, dtype=self.DTYPE_DATA)
+        return np.memmap(self.path+self.EXT_DATA, dtype=self.DTYPE_DATA, mode="r")
+
+    # Returns the start offset of each batch as a numpy array
+    def batches(self):
+        if self.indexFile is not None:
+            self.indexFile.flush()
+        return np.fromfile(self.path+self.EXT_INDEX, dtype=self.DTYPE_INDEX)
+
+    # Returns the FIFO words of one batch (index i) as a memory-mapped array
+    def batch(self, i):
+        offsets = self.batches()
+        words = self.words()
+        if i+1 < len(offsets):
+            return words[offsets[i]:offsets[i+1]]
+        return words[offsets[i]:]
+
+    # Number of FIFO words stored
+    def len(self):
+        return len(self.words())
@@ -0,0 +1,96 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/bitstats.py
+
+Streaming statistics of raw FIFO words.  Batches are reduced to a histogram of 16-bit codes and a histogram of bit toggles as they arrive, which is enough
+to get per-bit one counts and toggle rates, and the exact mean and variance for any weight vector, without building the weighted data array.
+Used by fpga.takeStats() for calibration, and useful to find stuck comparator bits.
+'''
+
+import numpy as np
+from fpga import bitMatrix, lookupTable
+
+# One row of 16 bits per code, MSB first.  Column 0 is the valid bit.
+CODE_BITS = bitMatrix(np.arange(65536, dtype=np.uint32)).astype(np.int64)
+
+class bitstats:
+    NUM_CODES = 65536
+
+    def __init__(self):
+        self.codes = np.zeros(self.NUM_CODES, dtype=np.int64)     # Number of samples of each 16-bit code
+        self.toggles = np.zeros(self.NUM_CODES, dtype=np.int64)   # Number of consecutive sample pairs with each XOR pattern
+        self.batches = 0
+        self.blank = 0      # Number of samples whose weighted data is zero for any weights, e.g. from fpga noConnect mode
+
+    # Adds a batch of FIFO words.  Toggles are only counted within a batch since batches are not contiguous in time.
+    # Input: words (array of FIFO words, only the lower 16 bits are used)
+    def add(self, words):
+        words = np.asarray(words) & 0xFFFF
+        self.codes += np.bincount(words, minlength=self.NUM_CODES)
+        if len(words) > 1:
+            self.toggles += np.bincount(words[1:] ^ words[:-1], minlength=self.NUM_CODES)
+        self.batches = self.batches + 1
+
+    # Adds samples that stand for zero data, the same as takeData returns without a connection.  They count as samples with all bits zero,
+    # but add zero to the mean for any weights, including bipolar ones.
+    # Input: n (number of samples)
+    def addBlank(self, n):
+        self.blank = self.blank + n
+        self.batches = self.batches + 1
+
+    # Adds the statistics of another bitstats
+    def merge(self, other):
+        self.codes += other.codes
+        self.toggles += other.toggles
+        self.batches = self.batches + other.batches
+        self.blank = self.blank + other.blank
+
+    # Number of samples
+    def count(self):
+        return int(self.codes.sum()) + self.blank
+
+    # Number of samples without the valid bit
+    def invalid(self):
+        return int(self.codes[:self.NUM_CODES//2].sum())
+
+    # Number of ones of each bit.  Blank samples have no ones.
+    # Return: numpy array of 16 counts, MSB first.  Index 0 is the valid bit.
+    def ones(self):
+        return self.codes @ CODE_BITS
+
+    # Fraction of consecutive samples where each bit changes
+    # Return: numpy array of 16 rates, MSB first
+    def toggleRate(self):
+        pairs = self.toggles.sum()
+        if pairs == 0:
+            return np.zeros(16)
+        return (self.toggles @ CODE_BITS)/pairs
+
+    # Bits that never change over the whole capture
+    # Return: list of (bit index, value) pairs, bit index 0 is the valid bit
+    def stuck(self):
+        ones = self.ones()
+        n = self.count()
+        return [(i, int(ones[i] > 0)) for i in range(16) if (n > 0) and (ones[i] in (0, n))]
+
+    # Mean of the weighted data
+    # Input: weighting (list of 16 weights, MSB to LSB), bipolar (boolean)
+    def mean(self, weighting, bipolar=False):
+        n = self.count()
+        if n == 0:
+            raise ValueError("No samples.  Were all batches dropped?")
+        lut = lookupTable(tuple(np.asarray(weighting).tolist()), bool(bipolar))
+        return float(self.codes @ lut)/n
+
+    # Variance of the weighted data
+    # Input: weighting (list of 16 weights, MSB to LSB), bipolar (boolean)
+    def var(self, weighting, bipolar=False):
+        n = self.count()
+        if n == 0:
+            raise ValueError("No samples.  Were all batches dropped?")
+        lut = lookupTable(tuple(np.asarray(weighting).tolist()), bool(bipolar)).astype(float)
+        mean = (self.codes @ lut)/n
+        return float(self.codes @ ((lut - mean)**2) + self.blank*(mean**2))/n
@@ -0,0 +1,81 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/boards.py
+
+Concurrent acquisition on several CryoSAR1 setups.  Opens one fpga instance per XEM device and runs takeData on all of them at once from worker threads,
+so N boards take about the wall time of one.
+
+The default register transfers work with the shipped firmware, but register reads hold the Python interpreter lock, so the transfers of the boards take turns.
+With firmware that has pipe-out fpga.ADDR_PIPEOUT, pass transfer="pipe": the pipe reads use the FrontPanel 'Thr' calls, which release the lock.
+
+The path to libokFrontPanel.so must be exported as an environment variable to $LD_LIBRARY_PATH
+'''
+
+import time
+import threading
+import concurrent.futures
+import fpga
+
+class boards:
+    BARRIER_TIMEOUT = 10        # Time for all boards to reach the start of a capture, in seconds
+
+    # Inputs: serials (list of XEM serial numbers, or None for all connected devices), xems (list of FrontPanel backends, e.g. simulators, used instead of serials)
+    # Additional keyword arguments are passed to every fpga instance (transfer, fillDetect, executor, profile, ...).
+    def __init__(self, serials=None, xems=None, **kwargs):
+        if kwargs.get("noConnect", False):
+            raise ValueError("boards needs connected devices.")
+        if xems is not None:
+            self.boards = [fpga.fpga(xem=xem, **kwargs) for xem in xems]
+        else:
+            if serials is None:
+                serials = fpga.listSerials()
+            if len(serials) == 0:
+                raise ValueError("No XEM device found.")
+            self.boards = [fpga.fpga(serial=serial, **kwargs) for serial in serials]
+        self.serials = [board.xem.GetSerialNumber() for board in self.boards]
+        self.pool = concurrent.futures.ThreadPoolExecutor(len(self.boards))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.boards)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        for board in self.boards:
+            board.close()
+
+    # Takes data on all boards concurrently
+    # Inputs: same as fpga.takeData.  progress defaults to "none" since boards would overwrite each other's progress line.
+    # Output: list with one tuple per board, in the order of self.boards: (data, all valid, datar2, start, end)
+    # start and end are host timestamps (time.time()) taken right after all boards passed a common barrier and when the board finished.
+    # Any exception from a board is raised after all boards have finished.
+    def takeData(self, *args, **kwargs):
+        kwargs.setdefault("progress", "none")
+        barrier = threading.Barrier(len(self.boards), timeout=self.BARRIER_TIMEOUT)
+        futures = [self.pool.submit(self.__capture, board, barrier, args, kwargs) for board in self.boards]
+        concurrent.futures.wait(futures)
+        return [f.result() for f in futures]
+
+    # Worker of takeData
+    def __capture(self, board, barrier, args, kwargs):
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            raise TimeoutError("Not all boards reached the start of the capture.")
+        start = time.time()
+        data, valid, datar2 = board.takeData(*args, **kwargs)
+        return data, valid, datar2, start, time.time()
+
+    # Largest difference between the start timestamps of a takeData result, in seconds
+    @staticmethod
+    def skew(results):
+        starts = [r[3] for r in results]
+        return max(starts) - min(starts)
@@ -0,0 +1,33 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+calcINLDNL
+'''
+
+import numpy as np
+
+
+# function to calculate DNL then INL from a sine wave histogram
+# https://gitlab.cern.ch/jgonski/colutaanalysis/-/blob/dev_kiryeong/cv4_analysis/plotting/plots_slow_sine.py
+# https://www3.advantest.com/documents/11348/27fd03db-3c5d-49e7-afb9-e0bcb6861cee
+# Input: data (list of numbers representing time domain data of a full-scale sine wave, in LSB)
+# Return: codes (list), DNL (list, one element shorter than codes), INL (list), hist (list, normalized histogram)
+def calcINLDNL(data):
+    data = np.round(data)
+    # Histogram
+    hist, bin_edges = np.histogram(data, bins = np.arange(np.min(data), np.max(data), 1), density=True)
+    bin_edges = bin_edges[:-1]
+    # Best fit method from sine wave
+    A = (np.max(data)-np.min(data))/2
+    M = np.sum(hist)   # This needs to equal unity
+    sum_Hk = np.cumsum(hist)    # Cumulative distribution function
+    # Back-calculate the probability distribution function to obtain the transition locations
+    V_j = -A*np.cos((np.pi/M)*sum_Hk)
+    # Calculate DNL
+    dnl = np.diff(V_j) - 1
+    # Perform best line of fit, for use in INL
+    V_fit = np.poly1d(np.polyfit(bin_edges, V_j, 1))
+    inl = V_j - V_fit(bin_edges)
+    return bin_edges, dnl, inl, hist
@@ -9,11 +9,9 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 '''
 
 
-import ok
 import time
 import sys
 import os
-import subprocess
 import numpy as np
 from bitstring import BitArray
 from multiprocessing import Pool
@@ -21,6 +19,9 @@ from itertools import repeat
 
 import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SControl"))
+import slowcontrol
+
 class calibration:
     # When assigning variables from these class constants, a deep copy must be performed to avoid altering the constants!     
     CAL_WEIGHTS_DEFAULT = [0.0, 1940.0, 1110.0, 635.0, 365.0, 210.0, 120.0, 70.0, 40.0, 24.0, 14.0, 8.0, 5.0, 3.0, 2.0, 1.0]   # 12bRC arrangement.  List elements must be of type float.
@@ -41,11 +42,16 @@ class calibration:
     CAL_WEIGHTS_END = 15        # LSB index to end calibration at
     CAL_WEIGHTS_SEED = np.multiply(CAL_WEIGHTS_DEFAULT, [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1])   # Only enable slices that have known/assumed weights
     CAL_WEIGHTS_SLICEEN_NONE = "000000000000000"  
+    ## Constants related to slow-control
+    CAL_CFGFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SControl", "config", "CryoSAR1.cfg")
     
 
-    def __init__(self, fpga):
+    # Input: fpga (instance of class fpga, or a daemon client), sc (slowcontrol.slowcontrol instance, or None to open one on first use)
+    def __init__(self, fpga, sc=None):
         # Instance of class fpga
         self.fpga = fpga
+        # Instance of class slowcontrol
+        self.sc = sc
         # calibrated ODAC value, bit string
         self.odac = None
         # TODO: remove hard code
@@ -59,17 +65,17 @@ class calibration:
     # Helper function to configure chip
     # Input: settings to explicitly modify in list name/value pair form: ["<name1>,<value1>", "<name2>,<value2>, ...] where name is from config file and value is bitstring
     def __config(self, args):
-        # Insert element "-o" before each item in args list
-        for b in range (0,len(args)):
-            args.insert(b*2,"-o")
-
-        try:
-            subprocess.run(["./../SControl/SControl.py", 
-                "-b"]
-                + args +
-                ["-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
-        except Exception as e:
-            sys.exit(e)
+        # Acquisition daemon client: the daemon programs the chip
+        if hasattr(self.fpga, "program"):
+            self.fpga.program(args)
+            return
+        if self.sc is None:
+            if hasattr(self.fpga.xem, "query"):
+                # Simulated hardware: the simulator is also the SPI port, and needs no settling time
+                self.sc = slowcontrol.slowcontrol(self.CAL_CFGFILE, spi=self.fpga.xem, settle=0)
+            else:
+                self.sc = slowcontrol.slowcontrol(self.CAL_CFGFILE)
+        self.sc.apply(args)
 
     # Calibrate offset by observing the statistics of the LSB bit flipping
     def calibrate_ODAC_using_LSB(self):
@@ -84,9 +90,9 @@ class calibration:
                 "SLICE_EN_N,"+self.CAL_ODAC_SLICEEN,
                 "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
             ])
-            # Take data, get mean of LSB bit flips
-            data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_ODAC_WEIGHTS, bipolar=True, printBinary=False)
-            if (np.mean(data) > 0):
+            # Take statistics, get mean of LSB bit flips
+            mean = self.fpga.takeStats("data").mean(self.CAL_ODAC_WEIGHTS, bipolar=True)
+            if (mean > 0):
                 odac_value = odac_value - odac_weight
             else:
                 odac_value = odac_value + odac_weight
@@ -94,7 +100,7 @@ class calibration:
             odac_weight = odac_weight/2
             # Debug printing
             print("== ITERATION "+str(i)+" ==")
-            print("Mean: "+str(np.mean(data)))
+            print("Mean: "+str(mean))
             print("ODAC uint8: "+str(odac_value))
             print("ODAC binary: "+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin)
         # Update class attribute
@@ -106,8 +112,8 @@ class calibration:
                 "SLICE_EN_N,"+self.CAL_ODAC_SLICEEN,
                 "ODAC_CODE,"+self.odac
             ])
-        data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_ODAC_SEED, bipolar=True, printBinary=False)
-        print("Final Mean: "+str(np.mean(data)))
+        mean = self.fpga.takeStats("data").mean(self.CAL_ODAC_SEED, bipolar=True)
+        print("Final Mean: "+str(mean))
         print("==== ODAC CALIBRATION (LSB method)====")
         print("Calibrated ODAC: \""+str(self.odac)+"\"")
         print("==== ====")
@@ -150,15 +156,15 @@ class calibration:
                     "SLICE_EN_N,"+cal_sliceen,
                     "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
                 ])
-            # Take data, get mean of downstream slices
-            data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_ODAC_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
+            # Take statistics, get mean of downstream slices
+            mean = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_ODAC_SEED, bipolar=True)
             if bsel is False:
-                if (np.mean(data) > 0):
+                if (mean > 0):
                     odac_value = odac_value - odac_weight
                 else:
                     odac_value = odac_value + odac_weight
             else:
-                if (np.mean(data) > 0):
+                if (mean > 0):
                     odac_value = odac_value + odac_weight
                 else:
                     odac_value = odac_value - odac_weight
@@ -166,7 +172,7 @@ class calibration:
             odac_weight = odac_weight/2
             # Debug printing
             print("== ITERATION "+str(i)+" ==")
-            print("Mean: "+str(np.mean(data)))
+            print("Mean: "+str(mean))
             print("ODAC uint8: "+str(odac_value))
             print("ODAC binary: "+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin)
         # Update class attribute
@@ -196,8 +202,8 @@ class calibration:
                 "SLICE_EN_N,"+cal_sliceen,
                 "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
             ])
-        data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_ODAC_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
-        print("Final Mean: "+str(np.mean(data)))
+        mean = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_ODAC_SEED, bipolar=True)
+        print("Final Mean: "+str(mean))
         print("==== ODAC CALIBRATION (weights method)====")
         print("Calibrated ODAC: \""+str(self.odac)+"\"")
         print("==== ====")
@@ -239,8 +245,7 @@ class calibration:
                     "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
                 ])
             # Take data
-            data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_WEIGHTS_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
-            force0 = np.mean(data)
+            force0 = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_WEIGHTS_SEED, bipolar=True)
             # Set ODAC code, force 1
             if bsel is False:
                 self.__config([
@@ -267,8 +272,7 @@ class calibration:
                     "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
                 ])
             # Take data
-            data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_WEIGHTS_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
-            force1 = np.mean(data)
+            force1 = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_WEIGHTS_SEED, bipolar=True)
             if bsel is False:
                 if (np.mean([force0, force1]) > 0):
                     odac_value = odac_value - odac_weight
@@ -315,8 +319,7 @@ class calibration:
                 "SLICE_EN_N,"+cal_sliceen,
                 "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
             ])
-        data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_WEIGHTS_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
-        force0 = np.mean(data)
+        force0 = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_WEIGHTS_SEED, bipolar=True)
         if bsel is False:
             self.__config([
                 "CAL_EN,1",
@@ -341,8 +344,7 @@ class calibration:
                 "SLICE_EN_N,"+cal_sliceen,
                 "ODAC_CODE,"+BitArray(uint=int(odac_value), length=self.CAL_ODAC_BITWIDTH).bin
             ])
-        data,valid,nc = self.fpga.takeData("data", weighting=self.CAL_WEIGHTS_SEED, bipolar=True, printBinary=False, mult=self.CAL_ODAC_MULT)
-        force1 = np.mean(data)
+        force1 = self.fpga.takeStats("data", mult=self.CAL_ODAC_MULT).mean(self.CAL_WEIGHTS_SEED, bipolar=True)
         print("==== ODAC CALIBRATION (weights method v2)====")
         print("Force 0: "+str(force0))
         print("Force 1: "+str(force1))
@@ -378,8 +380,7 @@ class calibration:
                 "ODAC_CODE,"+self.odac
             ])
             # Take data, get mean 
-            data,valid,nc = self.fpga.takeData("data", weighting=weights_pdac, bipolar=True, printBinary=False, mult=self.CAL_WEIGHTS_MULT)
-            w_pdac_force0 = np.mean(data)
+            w_pdac_force0 = self.fpga.takeStats("data", mult=self.CAL_WEIGHTS_MULT).mean(weights_pdac, bipolar=True)
             print("Measured P-DAC force 0: "+str(w_pdac_force0))
             ###
             #fig, axs = plt.subplots(1,1,tight_layout=True)
@@ -400,8 +401,7 @@ class calibration:
                 "ODAC_CODE,"+self.odac
             ])
             # Take data, get mean 
-            data,valid,nc = self.fpga.takeData("data", weighting=weights_pdac, bipolar=True, printBinary=False, mult=self.CAL_WEIGHTS_MULT)
-            w_pdac_force1 = np.mean(data)
+            w_pdac_force1 = self.fpga.takeStats("data", mult=self.CAL_WEIGHTS_MULT).mean(weights_pdac, bipolar=True)
             print("Measured P-DAC force 1: "+str(w_pdac_force1))
             ###
             #fig, axs = plt.subplots(1,1,tight_layout=True)
@@ -430,8 +430,7 @@ class calibration:
                 "ODAC_CODE,"+self.odac
             ])
             # Take data, get mean 
-            data,valid,nc = self.fpga.takeData("data", weighting=weights_ndac, bipolar=True, printBinary=False, mult=self.CAL_WEIGHTS_MULT)
-            w_ndac_force0 = np.mean(data)
+            w_ndac_force0 = self.fpga.takeStats("data", mult=self.CAL_WEIGHTS_MULT).mean(weights_ndac, bipolar=True)
             print("Measured N-DAC force 0: "+str(w_ndac_force0))
             ###
             #fig, axs = plt.subplots(1,1,tight_layout=True)
@@ -452,8 +451,7 @@ class calibration:
                 "ODAC_CODE,"+self.odac
             ])
             # Take data, get mean 
-            data,valid,nc = self.fpga.takeData("data", weighting=weights_ndac, bipolar=True, printBinary=False, mult=self.CAL_WEIGHTS_MULT)
-            w_ndac_force1 = np.mean(data)
+            w_ndac_force1 = self.fpga.takeStats("data", mult=self.CAL_WEIGHTS_MULT).mean(weights_ndac, bipolar=True)
             print("Measured N-DAC force 1: "+str(w_ndac_force1))
             ###
             #fig, axs = plt.subplots(1,1,tight_layout=True)
@@ -0,0 +1,121 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/client.py
+
+Client of the acquisition daemon (daemon.py).  Offers takeData and stream with the same arguments and outputs as fpga, plus program() for slow-control,
+so a client can stand in for an fpga instance, e.g. in calibration.calibration(client.client()).
+'''
+
+import socket
+import numpy as np
+import fpga
+import daemon
+import bitstats
+
+class client:
+    ## Constants of the fpga class, for scripts that read them from their fpga instance
+    SER_RATE = fpga.fpga.SER_RATE
+    SER_WIDTH = fpga.fpga.SER_WIDTH
+    FIFO_MAXDEPTH = fpga.fpga.FIFO_MAXDEPTH
+    DEF_WEIGHTS = fpga.fpga.DEF_WEIGHTS
+
+    # Input: path (Unix socket of the daemon)
+    def __init__(self, path=daemon.DEF_SOCKET):
+        self.path = path
+        self.sock = self.connect()
+        # Counts of non-valid samples of the last takeData call, see fpga.takeData
+        self.invalid = {"words": 0, "batches": 0, "retried": 0, "dropped": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    # Sends a request and receives its reply
+    # Input: command (string), arrays (list of numpy arrays), additional header fields
+    # Return: header, arrays of the reply.  A failed request raises RuntimeError with the daemon's error message.
+    def request(self, command, arrays=(), sock=None, **fields):
+        if sock is None:
+            sock = self.sock
+        fields["command"] = command
+        daemon.send(sock, fields, arrays)
+        return self.reply(sock)
+
+    # Receives one reply frame
+    def reply(self, sock):
+        header, arrays = daemon.receive(sock)
+        if not header["ok"]:
+            raise RuntimeError("Daemon: "+header["error"])
+        return header, arrays
+
+    # Return: dictionary with the serial number and process ID of the daemon
+    def ping(self):
+        return self.request("ping")[0]
+
+    # Programs the slow-control configuration: file defaults plus overrides, then readback
+    # Input: list of '<field name>,<value>' strings
+    def program(self, overrides):
+        self.request("program", overrides=list(overrides))
+
+    # Weights are sent as an array to keep their dtype (which sets the dtype of data).  None is sent in the request arguments.
+    def weightArrays(self, weighting, kwargs):
+        if weighting is None:
+            kwargs["weighting"] = None
+            return []
+        return [np.asarray(weighting)]
+
+    # Same as fpga.takeData.  progress is ignored.
+    def takeData(self, source="data", numSamples=FIFO_MAXDEPTH, weighting=DEF_WEIGHTS, bipolar=False, printBinary=False, mult=1, out=None, pipelined=False, progress="loop", invalid="raise", retries=fpga.fpga.INVALID_RETRIES):
+        kwargs = {"source": source, "numSamples": numSamples, "bipolar": bipolar, "printBinary": printBinary, "mult": mult, "pipelined": pipelined, "invalid": invalid, "retries": retries}
+        header, arrays = self.request("takeData", self.weightArrays(weighting, kwargs), kwargs=kwargs)
+        self.invalid = header["invalid"]
+        data, datar2 = arrays[0], arrays[1]
+        if out is not None:
+            out[0][:len(data)] = data
+            out[1][:len(datar2)] = datar2
+            data, datar2 = out[0][:len(data)], out[1][:len(datar2)]
+        if header["valid"] is None:
+            return data, arrays[2], datar2
+        return data, header["valid"], datar2
+
+    # Same as fpga.takeStats.  progress is ignored.
+    def takeStats(self, source="data", numSamples=FIFO_MAXDEPTH, mult=1, pipelined=False, progress="loop", invalid="raise", retries=fpga.fpga.INVALID_RETRIES, stats=None):
+        kwargs = {"source": source, "numSamples": numSamples, "mult": mult, "pipelined": pipelined, "invalid": invalid, "retries": retries}
+        header, arrays = self.request("takeStats", kwargs=kwargs)
+        self.invalid = header["invalid"]
+        result = bitstats.bitstats()
+        result.codes, result.toggles = arrays
+        result.batches = header["batches"]
+        result.blank = header["blank"]
+        if stats is None:
+            return result
+        stats.merge(result)
+        return stats
+
+    # Same as fpga.stream.  Runs on its own connection, so breaking out of the loop and closing the generator cancels the stream.
+    def stream(self, source="data", weighting=DEF_WEIGHTS, bipolar=False, numSamples=FIFO_MAXDEPTH, count=None, depth=fpga.fpga.PIPELINE_DEPTH):
+        kwargs = {"source": source, "bipolar": bipolar, "numSamples": numSamples, "count": count, "depth": depth}
+        sock = self.connect()
+        try:
+            header, arrays = self.request("stream", self.weightArrays(weighting, kwargs), sock=sock, kwargs=kwargs)
+            while not header.get("done", False):
+                yield arrays[0], header["valid"], arrays[1]
+                header, arrays = self.reply(sock)
+        finally:
+            sock.close()
+
+    # Stops the daemon
+    def shutdown(self):
+        self.request("shutdown")
@@ -0,0 +1,204 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/daemon.py
+
+Acquisition daemon.  Keeps the XEM (fpga) and FTDI (slow-control SPI) handles open and serves requests from scripts and notebooks over a Unix socket,
+so sequential experiments do not pay for OpenBySerial, ConfigureFPGA, and opening the FTDI device each time.  Use client.py to connect.
+
+Protocol: each message is a frame of
+    uint32 little-endian header length, JSON header, then the raw bytes of each array listed in header["arrays"] as [dtype, shape] pairs
+Arrays are sent straight from and received straight into numpy buffers, without copies or pickling.
+
+Requests (header["command"]):
+    "ping" -> serial number and process ID of the daemon
+    "program" (overrides: list of '<field name>,<value>') -> configuration file defaults plus the overrides are programmed and read back, same as 'SControl.py -b -o ...'
+    "takeData" (kwargs: fpga.takeData arguments, weighting as the first array) -> data, datar2 (and the valid mask for invalid="mask")
+    "stream" (kwargs: fpga.stream arguments, weighting as the first array) -> one frame per batch, then a frame with "done"
+    "takeStats" (kwargs: fpga.takeStats arguments) -> code and toggle histograms of a bitstats
+    "shutdown"
+Replies have "ok" and, on failure, "error".  Hardware access is serialized: one request runs at a time.
+
+Usage: ./daemon.py [-s socket] [--sim] [-a FTDI address] [-f cfg file] [-t transfer] [-d fill detection]
+The path to libokFrontPanel.so must be exported as an environment variable to $LD_LIBRARY_PATH
+'''
+
+import os
+import sys
+import json
+import struct
+import argparse
+import tempfile
+import threading
+import socketserver
+import numpy as np
+import fpga
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SControl"))
+import slowcontrol
+
+DEF_SOCKET = os.path.join(tempfile.gettempdir(), "cryosar1.sock")
+DEF_CFGFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SControl", "config", "CryoSAR1.cfg")
+FRAME_HEADER = struct.Struct("<I")
+
+
+# Sends one frame
+# Input: sock (connected socket), header (JSON-serializable dictionary), arrays (list of numpy arrays)
+def send(sock, header, arrays=()):
+    arrays = [np.ascontiguousarray(a) for a in arrays]
+    header = dict(header)
+    header["arrays"] = [[a.dtype.str, list(a.shape)] for a in arrays]
+    encoded = json.dumps(header).encode()
+    sock.sendall(FRAME_HEADER.pack(len(encoded)) + encoded)
+    for a in arrays:
+        if a.nbytes > 0:
+            sock.sendall(memoryview(a).cast("B"))
+
+# Receives exactly len(view) bytes into view
+def receiveInto(sock, view):
+    while len(view) > 0:
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError("Connection closed.")
+        view = view[n:]
+
+# Receives one frame
+# Input: sock (connected socket)
+# Return: header (dictionary), arrays (list of numpy arrays)
+def receive(sock):
+    length = bytearray(FRAME_HEADER.size)
+    receiveInto(sock, memoryview(length))
+    encoded = bytearray(FRAME_HEADER.unpack(length)[0])
+    receiveInto(sock, memoryview(encoded))
+    header = json.loads(encoded.decode())
+    arrays = []
+    for dtype, shape in header.pop("arrays", []):
+        a = np.empty(shape, dtype=np.dtype(dtype))
+        receiveInto(sock, memoryview(a).cast("B"))
+        arrays.append(a)
+    return header, arrays
+
+
+class handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.daemon.serveConnection(self.request)
+
+
+class daemon:
+    # Inputs: fpga (fpga instance), sc (slowcontrol.slowcontrol instance, or None to disable programming), path (Unix socket path)
+    def __init__(self, fpga, sc=None, path=DEF_SOCKET):
+        self.fpga = fpga
+        self.sc = sc
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, handler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+
+    # Serves requests until a shutdown request
+    def serve(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.fpga.close()
+
+    # Serves the requests of one client connection until it disconnects
+    def serveConnection(self, sock):
+        while True:
+            try:
+                header, arrays = receive(sock)
+            except ConnectionError:
+                return
+            try:
+                self.execute(sock, header, arrays)
+            except (ConnectionError, BrokenPipeError):
+                return
+            except Exception as e:
+                send(sock, {"ok": False, "error": type(e).__name__+": "+str(e)})
+
+    # Executes one request and sends the reply
+    def execute(self, sock, header, arrays):
+        command = header.get("command")
+        if command == "ping":
+            send(sock, {"ok": True, "serial": self.fpga.serial, "pid": os.getpid()})
+        elif command == "program":
+            with self.lock:
+                mismatch = self.program(header["overrides"])
+            if mismatch:
+                send(sock, {"ok": False, "error": "Readback incorrect for fields "+", ".join(mismatch)+".  Is the chip powered on?", "mismatch": mismatch})
+            else:
+                send(sock, {"ok": True})
+        elif command == "takeData":
+            kwargs = header.get("kwargs", {})
+            if arrays:
+                kwargs["weighting"] = arrays[0]
+            kwargs["progress"] = "none"
+            with self.lock:
+                data, valid, datar2 = self.fpga.takeData(**kwargs)
+                invalid = dict(self.fpga.invalid)
+            if isinstance(valid, np.ndarray):
+                send(sock, {"ok": True, "valid": None, "invalid": invalid}, [data, datar2, valid])
+            else:
+                send(sock, {"ok": True, "valid": bool(valid), "invalid": invalid}, [data, datar2])
+        elif command == "takeStats":
+            kwargs = header.get("kwargs", {})
+            kwargs["progress"] = "none"
+            with self.lock:
+                stats = self.fpga.takeStats(**kwargs)
+                invalid = dict(self.fpga.invalid)
+            send(sock, {"ok": True, "batches": stats.batches, "blank": stats.blank, "invalid": invalid}, [stats.codes, stats.toggles])
+        elif command == "stream":
+            kwargs = header.get("kwargs", {})
+            if arrays:
+                kwargs["weighting"] = arrays[0]
+            with self.lock:
+                batches = self.fpga.stream(**kwargs)
+                try:
+                    for data, valid, datar2 in batches:
+                        send(sock, {"ok": True, "valid": valid}, [data, datar2])
+                finally:
+                    batches.close()
+            send(sock, {"ok": True, "done": True})
+        elif command == "shutdown":
+            send(sock, {"ok": True})
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            raise ValueError("Unknown command "+str(command)+".")
+
+    # Programs the configuration file defaults plus overrides, and reads them back
+    # Input: list of '<field name>,<value>' strings
+    # Return: list of fields whose readback differs
+    def program(self, overrides):
+        if self.sc is None:
+            raise ValueError("Slow-control is not available in this daemon.")
+        return self.sc.apply(overrides, verify=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CryoSAR1 acquisition daemon.  Holds the FPGA and FTDI handles and serves requests over a Unix socket.')
+    parser.add_argument('-s', dest='socket', default=DEF_SOCKET, help="Unix socket path.  (Default: "+DEF_SOCKET+")")
+    parser.add_argument('--sim', dest='sim', action='store_true', default=False, help="Serve the behavioral simulator instead of hardware")
+    parser.add_argument('-a', dest='addr', default='ftdi://ftdi:232h:FT6X0PWN/1', help="FTDI address.  (Default: 'ftdi://ftdi:232h:FT6X0PWN/1')")
+    parser.add_argument('-f', dest='cfgFile', default=DEF_CFGFILE, help="Slow-control configuration file.  (Default: ../SControl/config/CryoSAR1.cfg)")
+    parser.add_argument('-t', dest='transfer', choices=["register", "pipe", "blockpipe"], default="register", help="Transfer mode.  (Default: register)")
+    parser.add_argument('-d', dest='fillDetect', choices=["sleep", "poll"], default="sleep", help="FIFO fill detection.  (Default: sleep)")
+    parser.add_argument('--serial', dest='serial', default="", help="XEM serial number.  (Default: first device found)")
+    args = parser.parse_args()
+
+    if args.sim:
+        import simulator
+        sim = simulator.simulator(cfgFile=args.cfgFile)
+        dev = fpga.fpga(transfer="pipe" if args.transfer == "register" else args.transfer, fillDetect=args.fillDetect, xem=sim)
+        sc = slowcontrol.slowcontrol(args.cfgFile, spi=sim, settle=0)
+    else:
+        dev = fpga.fpga(transfer=args.transfer, fillDetect=args.fillDetect, serial=args.serial)
+        sc = slowcontrol.slowcontrol(args.cfgFile, args.addr)
+    server = daemon(dev, sc, args.socket)
+    print("Serving on "+args.socket)
+    server.serve()
@@ -9,18 +9,28 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 '''
 
 
-import ok
+try:
+    import ok
+except ImportError:
+    # FrontPanel library not available.  Decoding functions still work (e.g. offline analysis), hardware access does not.
+    ok = None
 import time
 import sys
 import os
+import json
+import queue
+import hashlib
+import tempfile
+import collections
+import functools
+import threading
+import concurrent.futures
 import numpy as np
-from bitstring import BitArray
-from multiprocessing import Pool
-from itertools import repeat
 
 class fpga:
     ## Constants related to FPGA firmware/configuration
     FPGA_BITFILE = 'cryosar1_FPGARTL.bit'
+    FPGA_STATEFILE = os.path.join(tempfile.gettempdir(), 'cryosar1_fpga_state.json')  # Bitfile hash last configured on each device, by serial number
     ## Constants related to data taking
     ADDR_WIRE = 0x00
     DATA_FPGACOUNTER_RESET = 0x00000005
@@ -32,24 +42,168 @@ class fpga:
     FIFO_MAXDEPTH = 32768
     SER_RATE = 92000000    # Serialization speed, in Hz.  Also main ADC clock speed.
     SER_WIDTH = 8               # Number of bits serialized in one sampling period
+    ADDR_FIFOSTATUS = 0x20      # Wire-out reporting the FIFO fill status
+    MASK_FIFO_LEVEL = 0x0000FFFF    # Number of words in the FIFO
+    MASK_FIFO_FULL = 0x00010000     # FIFO full flag
+    FILL_POLL_INTERVAL = 0.0001     # Time between FIFO status polls, in seconds
+    FILL_TIMEOUT = 0.1          # Time beyond the expected fill time before the FIFO is declared stalled, in seconds
+    ## Constants related to data transfer
+    ADDR_PIPEOUT = 0xA0         # Pipe-out endpoint draining the same FIFO as the register bridge
+    PIPE_ALIGN = 16             # Pipe transfer lengths must be a multiple of this many bytes (USB 3.0)
+    PIPE_BLOCKSIZE = 1024       # Block size in bytes for block-pipe transfers
+    PIPELINE_DEPTH = 4          # Maximum number of transferred batches waiting to be parsed in pipelined mode
+    INVALID_RETRIES = 3         # Default number of re-acquisitions of a batch with non-valid samples, for invalid = "retry"
+    ## Constants related to instrumentation
+    SPAN_HISTORY = 4096         # Number of batch spans kept in fpga.spans
+    ## Constants related to the parsing executor
+    EXECUTOR_THRESHOLD = 1048576    # In "auto" mode, parse() calls of at least this many words run on the thread pool.  takeData and stream batches (FIFO_MAXDEPTH words) stay inline, where the lookup is cheaper than dispatching it.
+    EXECUTOR_WORKERS = os.cpu_count()   # Number of workers in thread and process pools
     ## Constants related to data parsing
     MASK_VALID = [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]   
     DEF_WEIGHTS = [0, 1940, 1110, 635, 365, 210, 120, 70, 40, 24, 14, 8, 5, 3, 2, 1]   # 12bRC arrangement
     
 
-    def __init__(self, noConnect=False):
+    # Inputs: noConnect (boolean), transfer ("register", "pipe", "blockpipe") selects how FIFO data is moved to the host,
+    # fillDetect ("sleep", "poll") selects how to wait for the FIFO to fill.  "sleep" waits a fixed time.  "poll" watches wire-out ADDR_FIFOSTATUS, which requires firmware support.
+    # executor ("auto", "inline", "thread", "process", "shm") selects where parsing runs, see parse().
+    # xem: FrontPanel backend to use instead of ok.FrontPanel, e.g. simulator.simulator or fptrace.replayer.
+    # profile (boolean) records a timing span per batch, see takeData().  onBatch: function called with each span, or None.
+    # serial: serial number of the XEM device to open, or "" for the first one found.  See listSerials() and boards.py for several boards.
+    # forceConfigure (boolean): program the bitfile even if the device already runs it, see configure().
+    #
+    # Worker pools are only created on first use.  Call close(), or use the class in a 'with' statement, to shut them down.
+    def __init__(self, noConnect=False, transfer="register", fillDetect="sleep", executor="auto", xem=None, profile=False, onBatch=None, serial="", forceConfigure=False):
         self.noConnect = noConnect
-        # Initialize multi-processing for parsing data
-        self.pool = Pool(os.cpu_count())                         # Create a multiprocessing Pool
+        if transfer not in ("register", "pipe", "blockpipe"):
+            raise ValueError("Invalid transfer mode.")
+        self.transferMode = transfer
+        if fillDetect not in ("sleep", "poll"):
+            raise ValueError("Invalid FIFO fill detection mode.")
+        self.fillDetect = fillDetect
+        if executor not in ("auto", "inline", "thread", "process", "shm"):
+            raise ValueError("Invalid executor.")
+        self.executor = executor
+        self.pools = {}         # Lazily created worker pools, keyed by executor
+        self.pipebuf = {}       # Preallocated pipe transfer buffers, keyed by length in bytes
+        self.profile = profile
+        self.onBatch = onBatch
+        self.spans = collections.deque(maxlen=self.SPAN_HISTORY)    # Spans of the batches of the last takeData call, and of stream() batches
+        self.invalid = {"words": 0, "batches": 0, "retried": 0, "dropped": 0}    # Non-valid sample counts of the last takeData call
         # Initialize FPGA
-        self.xem = ok.FrontPanel()
+        if xem is not None:
+            self.xem = xem
+        elif ok is None:
+            if not self.noConnect:
+                raise ImportError("The FrontPanel library (ok.py and libokFrontPanel.so) is required to connect to the FPGA.")
+            self.xem = None
+        else:
+            self.xem = ok.FrontPanel()
+        self.serial = serial
         if not self.noConnect:
-            self.xem.OpenBySerial("")
-            self.xem.ConfigureFPGA(self.FPGA_BITFILE)
+            ret = self.xem.OpenBySerial(serial)
+            if serial and ret:
+                raise IOError("Could not open XEM device "+serial+", FrontPanel error code "+str(ret)+".")
+            self.configure(forceConfigure)
+
+    # Programs the FPGA with FPGA_BITFILE unless it already runs it
+    # Input: force (boolean, program regardless)
+    # Output: True if the FPGA was programmed
+    #
+    # The firmware has no ID readback, so the sha256 of the bitfile is recorded per device serial number in FPGA_STATEFILE after every successful configuration.
+    # Programming is skipped if the recorded hash matches the bitfile and the FrontPanel interface is up (which is false after a power cycle).
+    # The state file is in the temporary directory, so it does not outlive a reboot of the host.  Scripts that program other bitfiles use configureBitfile(),
+    # which records them too.  Use force if the device was programmed by another program.
+    # Backends that are not a physical device (attribute 'virtual', e.g. simulator and replayer) are always configured and never touch the state file.
+    def configure(self, force=False):
+        if getattr(self.xem, "virtual", False):
+            ret = self.xem.ConfigureFPGA(self.FPGA_BITFILE)
+            if ret:
+                raise IOError("Could not configure the FPGA with "+self.FPGA_BITFILE+", FrontPanel error code "+str(ret)+".")
+            return True
+        digest = bitfileDigest(self.FPGA_BITFILE)
+        serial = self.xem.GetSerialNumber()
+        if (not force) and (digest is not None) and (readState(self.FPGA_STATEFILE).get(serial) == digest) and self.xem.IsFrontPanelEnabled():
+            return False
+        ret = configureBitfile(self.xem, self.FPGA_BITFILE, self.FPGA_STATEFILE)
+        if ret:
+            raise IOError("Could not configure the FPGA with "+self.FPGA_BITFILE+", FrontPanel error code "+str(ret)+".")
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Shuts down any worker pools.  They are recreated if parsing is needed again.
+    def close(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+        self.pools = {}
+
+    # Returns the worker pool of the given executor ("thread", "process", "shm"), creating it on first use
+    def pool(self, executor):
+        if executor not in self.pools:
+            if executor == "thread":
+                self.pools[executor] = concurrent.futures.ThreadPoolExecutor(self.EXECUTOR_WORKERS)
+            else:
+                self.pools[executor] = concurrent.futures.ProcessPoolExecutor(self.EXECUTOR_WORKERS)
+        return self.pools[executor]
+
+    # Parses FIFO words with the configured executor
+    # Inputs and outputs: same as decode()
+    #
+    # Executors:
+    #   'inline' -> decode() in the calling thread
+    #   'thread' -> chunks decoded on a thread pool.  Numpy releases the interpreter lock during the table lookup.
+    #   'process' -> chunks pickled to a process pool and the results pickled back
+    #   'shm' -> chunks decoded on a process pool through shared memory, nothing but the weights is pickled
+    #   'auto' -> 'inline' below EXECUTOR_THRESHOLD words in this call, 'thread' otherwise
+    # printBinary always runs inline.
+    def parse(self, fifodata, weighting, bipolar, printBinary=False, out=None):
+        fifodata = np.asarray(fifodata, dtype=np.uint32)
+        executor = self.executor
+        if executor == "auto":
+            if len(fifodata) < self.EXECUTOR_THRESHOLD:
+                executor = "inline"
+            else:
+                executor = "thread"
+        if (executor == "inline") or printBinary or (weighting is None) or (len(fifodata) < self.EXECUTOR_WORKERS):
+            return decode(fifodata, weighting, bipolar, printBinary, out)
+        if out is None:
+            out = np.empty(len(fifodata), dtype=lookupTable(tuple(np.asarray(weighting).tolist()), bool(bipolar)).dtype)
+        valid = (fifodata >= 32768)
+        bounds = np.linspace(0, len(fifodata), self.EXECUTOR_WORKERS+1).astype(int)
+        chunks = [slice(bounds[i], bounds[i+1]) for i in range(self.EXECUTOR_WORKERS)]
+        pool = self.pool(executor)
+        if executor == "thread":
+            futures = [pool.submit(decode, fifodata[c], weighting, bipolar, False, out[c]) for c in chunks]
+            for f in futures:
+                f.result()
+        elif executor == "process":
+            futures = [pool.submit(decode, fifodata[c], weighting, bipolar) for c in chunks]
+            for c, f in zip(chunks, futures):
+                out[c] = f.result()[0]
+        else:
+            from multiprocessing import shared_memory
+            words = shared_memory.SharedMemory(create=True, size=fifodata.nbytes)
+            result = shared_memory.SharedMemory(create=True, size=out.nbytes)
+            try:
+                np.ndarray(fifodata.shape, dtype=fifodata.dtype, buffer=words.buf)[:] = fifodata
+                futures = [pool.submit(decodeShared, words.name, result.name, len(fifodata), out.dtype.str, c.start, c.stop, weighting, bipolar) for c in chunks]
+                for f in futures:
+                    f.result()
+                out[:] = np.ndarray(out.shape, dtype=out.dtype, buffer=result.buf)
+            finally:
+                words.close()
+                words.unlink()
+                result.close()
+                result.unlink()
+        return out, valid
 
     # Take data
     # Inputs: source ("data", "frame", "fpgacounter"), numSamples (1...32768), weighting (a list of 16 numbers from MSB to LSB), bipolar weighting (boolean)
-    # Outputs: data (list of numbers versus time), all valid (bool), datar2 (same as data but weighted using radix-2 unsigned binary)
+    # Outputs: data (numpy array of numbers versus time), all valid (bool), datar2 (numpy array, same as data but weighted using radix-2 unsigned binary)
     #
     # Case: source = data
     # weights from 'weighting' are applied
@@ -62,99 +216,624 @@ class fpga:
     # radix-2 weights are applied
     # output 'all valid' is always True
     #
-    # If option noConnect: data returns is a list of zeros of length numSamples and 'all valid' is always True
+    # If option noConnect: data returns is an array of zeros of length numSamples and 'all valid' is always True
     #
     # If bipolar weighting is true, then bits 0,1 is converted to -1,+1 when computing the dot product of bits and bit weights.  This option only applies to source = data.  
     #
     # Multiplicity: number of times to loop the fpga data taking (to get more than 32k samples but discontinuous)
-    def takeData(self, source="data", numSamples=FIFO_MAXDEPTH, weighting=DEF_WEIGHTS, bipolar=False, printBinary=False, mult=1):
+    #
+    # Output arrays are allocated once with length numSamples*mult and each batch is written into its own slice.
+    # To reuse memory across repeated captures, pass out=(data, datar2) with two numpy arrays of at least numSamples*mult elements.  The returned arrays are views of these.
+    #
+    # Pipelined: if true, a background thread fills and transfers batches while earlier batches are parsed and checked for validity.
+    # At most PIPELINE_DEPTH transferred batches wait to be parsed.  Results are identical to the serial mode.
+    #
+    # Progress: "loop" writes 'Loop i of n' as batches are taken, "summary" prints one line with the throughput (and the per-stage breakdown if profiling) when done,
+    # "none" prints nothing.
+    #
+    # Profiling: if self.profile is true, a span is recorded for every batch in self.spans (cleared on each call) and passed to self.onBatch.  A span is a dictionary of
+    # batch (index), samples, bytes (transferred over USB), start (time.perf_counter() at the start of the batch), and the durations in seconds of
+    # wire (reset and start wire-ins), fill (waiting for the FIFO), transfer, decode (parsing, including any executor dispatch), validity (valid bit check).
+    # With profiling off, nothing is timed.  Spans also hold the number of invalid words of the batch.
+    #
+    # Invalid: what to do with a batch holding samples without the valid bit.  The valid bit is checked per batch.
+    #   "raise" -> raise ValueError (earlier batches are lost)
+    #   "retry" -> re-acquire only the failed batch, up to 'retries' times, then raise ValueError.  In pipelined mode failed batches are re-acquired after the pipeline drains.
+    #   "drop" -> leave the failed batch out.  data and datar2 are shortened by numSamples per dropped batch.
+    #   "mask" -> keep the batch.  The second output is then a numpy boolean array, true for valid samples, instead of 'all valid'.
+    # Counts of invalid words, failed batches, re-acquisitions, and dropped batches are kept in self.invalid.
+    def takeData(self, source="data", numSamples=FIFO_MAXDEPTH, weighting=DEF_WEIGHTS, bipolar=False, printBinary=False, mult=1, out=None, pipelined=False, progress="loop", invalid="raise", retries=INVALID_RETRIES):
         # Sanity check
         if (numSamples > self.FIFO_MAXDEPTH) or (numSamples < 1):
             raise ValueError("Number of samples must be between 1 and 32768 inclusive.")
         if not isinstance(numSamples, int):
             raise ValueError("Number of samples must be integer.")
+        if source not in ("data", "frame", "fpgacounter"):
+            raise ValueError("Invalid data source.")
+        if progress not in ("loop", "summary", "none"):
+            raise ValueError("Invalid progress mode.")
+        if invalid not in ("raise", "retry", "drop", "mask"):
+            raise ValueError("Invalid non-valid sample policy.")
+        # Weights used in parsing
+        if (source == "data"):
+            weight = weighting
+        else:
+            weight = None
+        # Output arrays
+        data, datar2 = self.allocate(numSamples*mult, weight, out)
 
         if not self.noConnect:        
-            dataw_list = []
-            valid_list = []
-            datar2_list = []
-            for mult_loop in range(mult):
+            self.spans.clear()
+            self.invalid = {"words": 0, "batches": 0, "retried": 0, "dropped": 0}
+            if invalid == "mask":
+                validMask = np.empty(len(data), dtype=bool)
+            else:
+                validMask = None
+            failed = []
+            start = time.perf_counter()
+            if pipelined:
+                batches = self.acquireBatches(source, numSamples, mult, datar2, progress=(progress == "loop"))
+            else:
+                batches = self.acquireSerial(source, numSamples, mult, datar2, progress=(progress == "loop"))
+            try:
+                for k, (batch, span) in enumerate(batches):
+                    # Parse the whole batch at once, directly into this batch's slice of the output
+                    nInvalid = self.parseBatch(datar2[batch], data[batch], span, weight, bipolar, printBinary, validMask, batch)
+                    if nInvalid > 0:
+                        self.invalid["words"] = self.invalid["words"] + nInvalid
+                        self.invalid["batches"] = self.invalid["batches"] + 1
+                        if invalid == "raise":
+                            raise ValueError("Encountered "+str(nInvalid)+" non-valid samples in batch "+str(k)+".  Quitting.")
+                        if invalid != "mask":
+                            failed.append((k, batch))
+            finally:
+                # Stops the background thread, if any
+                batches.close()
+            if invalid == "retry":
+                # Re-acquire failed batches one at a time, into their own slice of the output
+                for k, batch in failed:
+                    for attempt in range(retries+1):
+                        if attempt == retries:
+                            raise ValueError("Batch "+str(k)+" still has non-valid samples after "+str(retries)+" retries.  Quitting.")
+                        self.invalid["retried"] = self.invalid["retried"] + 1
+                        for b, span in self.acquireSerial(source, numSamples, 1, datar2[batch], progress=False):
+                            if span is not None:
+                                span["batch"] = k
+                            nInvalid = self.parseBatch(datar2[batch], data[batch], span, weight, bipolar, printBinary)
+                        if nInvalid == 0:
+                            break
+                        self.invalid["words"] = self.invalid["words"] + nInvalid
+            elif invalid == "drop":
+                # Move the kept batches to the front of the output
+                dropped = set([k for k, batch in failed])
+                kept = 0
+                for k in range(mult):
+                    if k not in dropped:
+                        if k != kept:
+                            data[kept*numSamples:(kept+1)*numSamples] = data[k*numSamples:(k+1)*numSamples]
+                            datar2[kept*numSamples:(kept+1)*numSamples] = datar2[k*numSamples:(k+1)*numSamples]
+                        kept = kept + 1
+                self.invalid["dropped"] = len(dropped)
+                data = data[:kept*numSamples]
+                datar2 = datar2[:kept*numSamples]
+            if progress == "loop":
+                sys.stdout.write("\r")
+                sys.stdout.flush()
+            elif progress == "summary":
+                print(self.summary(len(data), time.perf_counter() - start))
+            if (self.invalid["words"] > 0) and (progress != "none"):
+                print("Non-valid samples: %i words in %i batches, %i batches re-acquired, %i batches dropped." % (self.invalid["words"], self.invalid["batches"], self.invalid["retried"], self.invalid["dropped"]))
+            if invalid == "mask":
+                return data, validMask, datar2
+            return data, True, datar2
+        else:
+            # No connect is asserted
+            data[:] = 0
+            datar2[:] = 0
+            if invalid == "mask":
+                return data, np.ones(len(data), dtype=bool), datar2
+            return data, True, datar2
+
+    # Parses one batch of takeData and completes its span
+    # Input: fifodata (FIFO words of the batch), out (slice of the output), span (dictionary or None), weight, bipolar, printBinary,
+    # validMask (boolean numpy array of the whole capture or None), batch (slice of the batch in validMask)
+    # Return: number of non-valid samples in the batch
+    def parseBatch(self, fifodata, out, span, weight, bipolar, printBinary, validMask=None, batch=None):
+        if span is not None:
+            t0 = time.perf_counter()
+        dataw, valid = self.parse(fifodata, weight, bipolar, printBinary, out=out)
+        if span is not None:
+            t1 = time.perf_counter()
+        nInvalid = len(valid) - int(np.count_nonzero(valid))
+        if validMask is not None:
+            validMask[batch] = valid
+        if span is not None:
+            span["decode"] = t1 - t0
+            span["validity"] = time.perf_counter() - t1
+            span["invalid"] = nInvalid
+            self.record(span)
+        return nInvalid
+
+    # Take statistics of the raw FIFO words instead of data
+    # Inputs: source, numSamples, mult, pipelined, progress (see takeData), invalid ("raise", "retry", "drop", see takeData), retries, stats (bitstats to add to, or None for a new one)
+    # Output: bitstats.bitstats with the code and toggle histograms of all valid batches.  Use its mean(weighting, bipolar) in place of np.mean of takeData's data.
+    #
+    # Each batch is reduced as soon as it is transferred, into a ring buffer of a few batches, so memory use does not grow with mult and no weighted array is built.
+    # If profiling, the 'decode' span holds the reduction time.
+    # If option noConnect: numSamples*mult blank samples are returned, so means are zero as for the zero data of takeData.
+    def takeStats(self, source="data", numSamples=FIFO_MAXDEPTH, mult=1, pipelined=False, progress="loop", invalid="raise", retries=INVALID_RETRIES, stats=None):
+        import bitstats
+        # Sanity check
+        if (numSamples > self.FIFO_MAXDEPTH) or (numSamples < 1):
+            raise ValueError("Number of samples must be between 1 and 32768 inclusive.")
+        if not isinstance(numSamples, int):
+            raise ValueError("Number of samples must be integer.")
+        if source not in ("data", "frame", "fpgacounter"):
+            raise ValueError("Invalid data source.")
+        if progress not in ("loop", "summary", "none"):
+            raise ValueError("Invalid progress mode.")
+        if invalid not in ("raise", "retry", "drop"):
+            raise ValueError("Invalid non-valid sample policy.")
+        if stats is None:
+            stats = bitstats.bitstats()
+        if self.noConnect:
+            # No connect is asserted.  Same as the zero data of takeData.
+            for k in range(mult):
+                stats.addBlank(numSamples)
+            return stats
+        self.spans.clear()
+        self.invalid = {"words": 0, "batches": 0, "retried": 0, "dropped": 0}
+        failed = []
+        start = time.perf_counter()
+        if pipelined:
+            ring = np.empty((self.PIPELINE_DEPTH+2)*numSamples, dtype=np.uint32)
+            batches = self.acquireBatches(source, numSamples, mult, ring, progress=(progress == "loop"))
+        else:
+            ring = np.empty(numSamples, dtype=np.uint32)
+            batches = self.acquireSerial(source, numSamples, mult, ring, progress=(progress == "loop"))
+        try:
+            for k, (batch, span) in enumerate(batches):
+                nInvalid = self.reduceBatch(ring[batch], span, stats, source)
+                if nInvalid > 0:
+                    self.invalid["words"] = self.invalid["words"] + nInvalid
+                    self.invalid["batches"] = self.invalid["batches"] + 1
+                    if invalid == "raise":
+                        raise ValueError("Encountered "+str(nInvalid)+" non-valid samples in batch "+str(k)+".  Quitting.")
+                    failed.append(k)
+        finally:
+            # Stops the background thread, if any
+            batches.close()
+        if invalid == "retry":
+            for k in failed:
+                for attempt in range(retries+1):
+                    if attempt == retries:
+                        raise ValueError("Batch "+str(k)+" still has non-valid samples after "+str(retries)+" retries.  Quitting.")
+                    self.invalid["retried"] = self.invalid["retried"] + 1
+                    for batch, span in self.acquireSerial(source, numSamples, 1, ring[:numSamples], progress=False):
+                        if span is not None:
+                            span["batch"] = k
+                        nInvalid = self.reduceBatch(ring[batch], span, stats, source)
+                    if nInvalid == 0:
+                        break
+                    self.invalid["words"] = self.invalid["words"] + nInvalid
+        else:
+            self.invalid["dropped"] = len(failed)
+        if progress == "loop":
+            sys.stdout.write("\r")
+            sys.stdout.flush()
+        elif progress == "summary":
+            print(self.summary(numSamples*(mult - self.invalid["dropped"]), time.perf_counter() - start))
+        if (self.invalid["words"] > 0) and (progress != "none"):
+            print("Non-valid samples: %i words in %i batches, %i batches re-acquired, %i batches dropped." % (self.invalid["words"], self.invalid["batches"], self.invalid["retried"], self.invalid["dropped"]))
+        return stats
+
+    # Reduces one batch of takeStats into stats, unless it holds non-valid samples, and completes its span
+    # Input: words (FIFO words of the batch), span (dictionary or None), stats (bitstats), source (only "data" has a valid bit)
+    # Return: number of non-valid samples in the batch
+    def reduceBatch(self, words, span, stats, source):
+        if span is not None:
+            t0 = time.perf_counter()
+        if source == "data":
+            nInvalid = len(words) - int(np.count_nonzero(words & 0x8000))
+        else:
+            nInvalid = 0
+        if span is not None:
+            t1 = time.perf_counter()
+        if nInvalid == 0:
+            stats.add(words)
+        if span is not None:
+            span["validity"] = t1 - t0
+            span["decode"] = time.perf_counter() - t1
+            span["invalid"] = nInvalid
+            self.record(span)
+        return nInvalid
+
+    # Stores a completed batch span and passes it to the onBatch callback
+    def record(self, span):
+        self.spans.append(span)
+        if self.onBatch is not None:
+            self.onBatch(span)
+
+    # One line summary of a capture
+    # Input: samples (total number of samples), elapsed (seconds)
+    # Output: string with the throughput, and the mean duration of each stage per batch if spans were recorded
+    def summary(self, samples, elapsed):
+        line = "Took %i samples in %0.3f s: %0.1f samples/s" % (samples, elapsed, samples/elapsed)
+        if len(self.spans) > 0:
+            stages = ["wire", "fill", "transfer", "decode", "validity"]
+            means = ["%s %0.3f ms" % (stage, 1e3*sum(span[stage] for span in self.spans)/len(self.spans)) for stage in stages]
+            line = line + ".  Per batch: " + ", ".join(means) + ", %i bytes" % (sum(span["bytes"] for span in self.spans)//len(self.spans))
+        return line
+
+    # Fills and transfers batches one after the other
+    # Input: source, numSamples, mult (see takeData, or None to run until closed), datar2 (numpy array to receive FIFO words, a whole number of batches long)
+    # Output: generator of (slice into datar2, span), one per batch, yielded after that batch is transferred.  span is None unless profiling, see takeData.
+    # If datar2 holds fewer than mult batches, it is used as a ring buffer.  Progress (boolean) prints the loop count.
+    def acquireSerial(self, source, numSamples, mult, datar2, progress=True):
+        slots = len(datar2)//numSamples
+        mult_loop = 0
+        while (mult is None) or (mult_loop < mult):
+            if progress and (mult is not None):
                 # Print
                 sys.stdout.write("\rLoop %i of %i" % (mult_loop, mult))
                 sys.stdout.flush()
+            slot = mult_loop % slots
+            batch = slice(slot*numSamples, (slot+1)*numSamples)
+            if not self.profile:
+                self.fill(source, numSamples)
+                datar2[batch] = self.transfer(numSamples)
+                span = None
+            else:
+                t0 = time.perf_counter()
+                self.command(source, False)
+                t1 = time.perf_counter()
+                self.waitReset()
+                t2 = time.perf_counter()
+                self.command(source, True)
+                t3 = time.perf_counter()
+                self.waitFill(numSamples)
+                t4 = time.perf_counter()
+                datar2[batch] = self.transfer(numSamples)
+                t5 = time.perf_counter()
+                span = {"batch": mult_loop, "samples": numSamples, "bytes": self.transferLength(numSamples), "start": t0,
+                        "wire": (t1-t0) + (t3-t2), "fill": (t2-t1) + (t4-t3), "transfer": t5-t4}
+            mult_loop = mult_loop + 1
+            yield batch, span
 
-                # Set FPGA to fill the FIFO
-                if (source == "data"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_CHIP_RESET)
-                elif (source == "frame"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FRAME_RESET)
-                elif (source == "fpgacounter"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FPGACOUNTER_RESET)
+    # Fills and transfers batches from a background thread
+    # Same inputs and outputs as acquireSerial, plus depth (maximum number of transferred batches waiting for the caller).
+    # Batch k+1 is filled and transferred while the caller works on batch k.
+    # When datar2 is a ring buffer it must hold at least depth+2 batches so a slot is never overwritten while the caller works on it.
+    # Closing the generator stops the thread after its current batch.
+    def acquireBatches(self, source, numSamples, mult, datar2, depth=PIPELINE_DEPTH, progress=True):
+        batchQueue = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self.__producer, args=(source, numSamples, mult, datar2, progress, batchQueue, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batchQueue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    # Streams decoded data for long or unbounded captures
+    # Inputs: source, weighting, bipolar, numSamples (see takeData), count (number of batches, or None to run until the generator is closed), depth (maximum number of batches in flight)
+    # Output: generator of (data, all valid, datar2) per batch, same meaning as in takeData.  Each yielded array is newly allocated and belongs to the caller.
+    #
+    # Batches are filled and transferred on a background thread while earlier batches are decoded and consumed, so memory use is bounded by depth regardless of the capture length.
+    # To cancel, break out of the loop and close the generator (or use contextlib.closing); the background thread stops after its current batch.
+    # Unlike takeData, a non-valid sample does not raise: check 'all valid' per batch.
+    def stream(self, source="data", weighting=DEF_WEIGHTS, bipolar=False, numSamples=FIFO_MAXDEPTH, count=None, depth=PIPELINE_DEPTH):
+        # Sanity check
+        if (numSamples > self.FIFO_MAXDEPTH) or (numSamples < 1):
+            raise ValueError("Number of samples must be between 1 and 32768 inclusive.")
+        if source not in ("data", "frame", "fpgacounter"):
+            raise ValueError("Invalid data source.")
+        if (source == "data"):
+            weight = weighting
+        else:
+            weight = None
+        if self.noConnect:
+            # No connect is asserted
+            n = 0
+            while (count is None) or (n < count):
+                data, datar2 = self.allocate(numSamples, weight)
+                data[:] = 0
+                datar2[:] = 0
+                n = n + 1
+                yield data, True, datar2
+            return
+        # Ring buffer of raw FIFO words shared with the background thread
+        ring = np.empty((depth+2)*numSamples, dtype=np.uint32)
+        batches = self.acquireBatches(source, numSamples, count, ring, depth, progress=False)
+        try:
+            for batch, span in batches:
+                datar2 = ring[batch].copy()
+                if span is None:
+                    data, valid = self.parse(datar2, weight, bipolar)
+                    allValid = bool(np.all(valid))
                 else:
-                    raise ValueError("Invalid data source.")
-                self.xem.UpdateWireIns()
-                time.sleep(0.001)
-                if (source == "data"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_CHIP_START)
-                elif (source == "frame"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FRAME_START)
-                elif (source == "fpgacounter"):
-                    self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FPGACOUNTER_START)
-                self.xem.UpdateWireIns()
-                # Wait for data to fill FIFO
-                wait_for_data = (numSamples*1.2)/(self.SER_RATE/self.SER_WIDTH)  # Expression to wait for the FIFO to fill + 20% margin
-                time.sleep(wait_for_data)
-                # Transfer data.  
+                    t0 = time.perf_counter()
+                    data, valid = self.parse(datar2, weight, bipolar)
+                    t1 = time.perf_counter()
+                    allValid = bool(np.all(valid))
+                    span["decode"] = t1 - t0
+                    span["validity"] = time.perf_counter() - t1
+                    self.record(span)
+                yield data, allValid, datar2
+        finally:
+            # Stops the background thread
+            batches.close()
+
+    # Background thread of acquireBatches.  Puts one (slice, span) per transferred batch into batchQueue, then None.  Exceptions are passed through the queue.
+    def __producer(self, source, numSamples, mult, datar2, progress, batchQueue, stop):
+        try:
+            for batch in self.acquireSerial(source, numSamples, mult, datar2, progress):
+                while not stop.is_set():
+                    try:
+                        batchQueue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            item = None
+        except Exception as e:
+            item = e
+        while not stop.is_set():
+            try:
+                batchQueue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    # Sets the FPGA to fill the FIFO and waits until it is filled
+    # Input: source ("data", "frame", "fpgacounter"), numSamples (1...32768)
+    def fill(self, source, numSamples):
+        self.command(source, False)
+        self.waitReset()
+        self.command(source, True)
+        self.waitFill(numSamples)
+
+    # Sends the reset or start command of a data source to the FPGA
+    # Input: source ("data", "frame", "fpgacounter"), start (boolean, False for reset)
+    def command(self, source, start):
+        if (source == "data"):
+            self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_CHIP_START if start else self.DATA_CHIP_RESET)
+        elif (source == "frame"):
+            self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FRAME_START if start else self.DATA_FRAME_RESET)
+        elif (source == "fpgacounter"):
+            self.xem.SetWireInValue(self.ADDR_WIRE, self.DATA_FPGACOUNTER_START if start else self.DATA_FPGACOUNTER_RESET)
+        else:
+            raise ValueError("Invalid data source.")
+        self.xem.UpdateWireIns()
+
+    # Waits for the FIFO reset to complete
+    def waitReset(self):
+        if self.fillDetect == "poll":
+            self.waitFIFO(0, self.FILL_TIMEOUT)
+        else:
+            time.sleep(0.001)
+
+    # Waits for data to fill the FIFO after a start command
+    # Input: numSamples (1...32768)
+    def waitFill(self, numSamples):
+        fill_time = numSamples/(self.SER_RATE/self.SER_WIDTH)
+        if self.fillDetect == "poll":
+            # Sleep through the nominal fill time, then poll for the remainder
+            time.sleep(fill_time)
+            self.waitFIFO(numSamples, fill_time + self.FILL_TIMEOUT)
+        else:
+            wait_for_data = fill_time*1.2  # Expression to wait for the FIFO to fill + 20% margin
+            time.sleep(wait_for_data)
+
+    # Polls the FIFO status wire-out until the FIFO holds a given number of words
+    # Input: numSamples (number of words to wait for, or 0 to wait for the FIFO to be empty), timeout (seconds)
+    # A stalled FIFO raises TimeoutError instead of being read out as garbage.
+    def waitFIFO(self, numSamples, timeout):
+        deadline = time.perf_counter() + timeout
+        while True:
+            self.xem.UpdateWireOuts()
+            status = self.xem.GetWireOutValue(self.ADDR_FIFOSTATUS)
+            level = status & self.MASK_FIFO_LEVEL
+            if numSamples == 0:
+                if (level == 0) and not (status & self.MASK_FIFO_FULL):
+                    return
+            elif (level >= numSamples) or (status & self.MASK_FIFO_FULL):
+                return
+            if time.perf_counter() > deadline:
+                raise TimeoutError("FIFO holds "+str(level)+" words after "+str(timeout)+" seconds, expected "+str(numSamples)+".  Is the data source running?")
+            time.sleep(self.FILL_POLL_INTERVAL)
+
+    # Allocates output arrays for takeData, or checks and slices caller-provided ones
+    # Input: length (number of samples), weighting (list of 16 bit weights or None for radix-2), out (None or a tuple of two numpy arrays (data, datar2))
+    # Output: data (numpy array), datar2 (numpy array of uint32), both of the given length
+    def allocate(self, length, weighting, out=None):
+        if out is None:
+            if weighting is None:
+                data = np.empty(length, dtype=np.uint32)
+            else:
+                data = np.empty(length, dtype=np.asarray(weighting).dtype)
+            datar2 = np.empty(length, dtype=np.uint32)
+            return data, datar2
+        data, datar2 = out
+        if (len(data) < length) or (len(datar2) < length):
+            raise ValueError("Output arrays must hold at least "+str(length)+" samples.")
+        return data[:length], datar2[:length]
+
+    # Number of bytes moved over USB to transfer numSamples words
+    def transferLength(self, numSamples):
+        if self.transferMode == "register":
+            return numSamples*4
+        if self.transferMode == "blockpipe":
+            align = self.PIPE_BLOCKSIZE
+        else:
+            align = self.PIPE_ALIGN
+        return -(-numSamples*4 // align)*align
+
+    # Transfer data out of the FIFO
+    # Input: numSamples (1...32768)
+    # Output: numpy array of uint32 FIFO words of length numSamples
+    #
+    # Transfer mode "register" reads the FIFO through the register bridge.  One SWIG object per word (one registerEntry without the FrontPanel library), slow but works on all firmware.
+    # Transfer modes "pipe" and "blockpipe" read the FIFO through pipe-out ADDR_PIPEOUT into a preallocated bytearray which is viewed as a numpy array without copying.
+    # The returned array of the pipe modes shares memory with the transfer buffer and is only valid until the next transfer of the same length.
+    # Pipe lengths are rounded up to PIPE_ALIGN (or PIPE_BLOCKSIZE) bytes.  The extra words are read out of the FIFO and discarded.
+    def transfer(self, numSamples):
+        if self.transferMode == "register":
+            if ok is None:
+                # Backends without the FrontPanel library (simulator, replayer) only need entries with a data field
+                fifodata = [registerEntry() for i in range(numSamples)]
+            else:
                 fifodata = ok.okTRegisterEntries(numSamples)
-                self.xem.ReadRegisters(fifodata)
-                # Pickle the data manually for multiprocessing
-                fifodata = [i.data for i in fifodata]
-                # Parse the data using multiprocessing
-                if (source == "data"):
-                    weight = weighting
-                elif (source == "frame"):
-                    weight = None
-                elif (source == "fpgacounter"):
-                    weight = None
-                result = self.pool.starmap(parse, zip(fifodata, repeat(weight), repeat(bipolar), repeat(printBinary)))
-                dataw, valid = zip(*result)
-                if not all(valid):
-                    raise ValueError("Encountered at least one non-valid sample.  Quitting.")
-                dataw_list.extend(dataw)
-                valid_list.extend(valid)
-                datar2_list.extend(fifodata)
-            sys.stdout.write("\r")
-            sys.stdout.flush()
-            return dataw_list, all(valid_list), datar2_list
+            self.xem.ReadRegisters(fifodata)
+            return np.fromiter((i.data for i in fifodata), dtype=np.uint32, count=numSamples)
+        # Pipe transfer
+        length = self.transferLength(numSamples)
+        if length not in self.pipebuf:
+            self.pipebuf[length] = bytearray(length)
+        buf = self.pipebuf[length]
+        # The 'Thr' variants release the Python interpreter lock during the transfer so other threads keep running
+        if self.transferMode == "blockpipe":
+            ret = self.xem.ReadFromBlockPipeOutThr(self.ADDR_PIPEOUT, self.PIPE_BLOCKSIZE, buf)
         else:
-            # No connect is asserted
-            return [0]*numSamples*mult, True, [0]*numSamples*mult        
+            ret = self.xem.ReadFromPipeOutThr(self.ADDR_PIPEOUT, buf)
+        if ret < 0:
+            raise IOError("Pipe transfer failed with FrontPanel error code "+str(ret)+".")
+        # Words are transferred little-endian
+        return np.frombuffer(buf, dtype='<u4', count=numSamples)
 
-# Method used by multiprocessing pool to parse data
-# Input: fifodata (uint16), and a list of 16 bit weights from MSB to LSB or "None" to use radix-2 weighting, and whether to use bipolar weighting
-# Return: weighted data, valid (only if weighting is not None) otherwise True
-def parse(fifodata, weighting, bipolar, printBinary):
-    #print(weighting) 
-    if weighting is None:
-        # Do nothing
-        return fifodata, True
-    else:
-        # Apply custom bit weighting
-        valid = (fifodata >= 32768)
-        fifodata = BitArray(uint=fifodata, length=16).bin  
-        fifodata = [*fifodata]    # split each bit into a list
-        fifodata = [eval(j) for j in fifodata]    # re-evaluate, convert char to int in bit list
-        if printBinary:
-            print(fifodata)
-        if bipolar:
-            fifodata = [(2*j)-1 for j in fifodata]    # Convert 0,1 to -1,+1
-            #fifodata = [0.5*j for j in fifodata]        # Re-normalize to account for the doubling in magnitude
-        return np.dot(fifodata, weighting), valid
+# Register entry of the register transfer mode when ok.okTRegisterEntries is not available
+class registerEntry:
+    __slots__ = ("address", "data")
 
+    def __init__(self, address=0, data=0):
+        self.address = address
+        self.data = data
 
+# Lists the serial numbers of the connected XEM devices
+# Return: list of strings
+def listSerials():
+    if ok is None:
+        raise ImportError("The FrontPanel library (ok.py and libokFrontPanel.so) is required to list devices.")
+    xem = ok.FrontPanel()
+    return [xem.GetDeviceListSerial(i) for i in range(xem.GetDeviceCount())]
 
+# Reads the configuration state file of fpga.configure()
+# Return: dictionary of device serial number to bitfile sha256, empty if the file is missing or unreadable
+def readState(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
+# Writes the configuration state file atomically.  The file is only a cache: if it cannot be written (e.g. it belongs to another user), it is left as is.
+def writeState(path, state):
+    tmp = path+"."+str(os.getpid())
+    try:
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
+# sha256 of a bitfile
+# Return: hex digest, or None if the file cannot be read
+def bitfileDigest(bitfile):
+    try:
+        with open(bitfile, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
 
+# Programs a device with a bitfile and records it in the configuration state file, so fpga.configure() knows which bitfile the device runs.
+# Use instead of xem.ConfigureFPGA in scripts that program their own bitfile.
+# Input: xem (FrontPanel device), bitfile (path), path (state file)
+# Return: FrontPanel error code of ConfigureFPGA
+def configureBitfile(xem, bitfile, path=fpga.FPGA_STATEFILE):
+    serial = xem.GetSerialNumber()
+    digest = bitfileDigest(bitfile)
+    ret = xem.ConfigureFPGA(bitfile)
+    state = readState(path)
+    if ret or (digest is None):
+        state.pop(serial, None)
+    else:
+        state[serial] = digest
+    writeState(path, state)
+    return ret
 
-    
+# Bit shifts that split a FIFO word into a bit matrix, MSB first.  Column 0 is the valid bit.
+BIT_SHIFTS = np.arange(15, -1, -1, dtype=np.uint32)
+# Number of lookup tables kept by lookupTable().  Each table is 65536 entries (512 kB for float weights).
+LUT_CACHE_SIZE = 8
+
+# Splits FIFO words into bits
+# Input: fifodata (array of uint16 FIFO words), bipolar (boolean, convert 0,1 to -1,+1)
+# Return: numpy int8 array with one row of 16 bits per word, MSB first
+def bitMatrix(fifodata, bipolar=False):
+    bits = ((np.asarray(fifodata, dtype=np.uint32)[:, np.newaxis] >> BIT_SHIFTS) & 1).astype(np.int8)
+    if bipolar:
+        bits = (2*bits)-1    # Convert 0,1 to -1,+1
+    return bits
+
+# Lookup table of the weighted output for every possible 16-bit FIFO word
+# Input: weighting (tuple of 16 bit weights from MSB to LSB), bipolar (boolean)
+# Return: read-only numpy array of 65536 weighted values, indexed by FIFO word
+# Tables are kept in a small LRU cache keyed by weights and bipolar setting, since calibration decodes many captures with the same few weight vectors.
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def lookupTable(weighting, bipolar):
+    lut = bitMatrix(np.arange(65536, dtype=np.uint32), bipolar) @ np.asarray(weighting)
+    lut.flags.writeable = False
+    return lut
+
+# Decodes a whole FIFO capture with one table lookup
+# Input: fifodata (array of uint16 FIFO words), and a list of 16 bit weights from MSB to LSB or "None" to use radix-2 weighting, and whether to use bipolar weighting
+# If out is given (numpy array of the same length as fifodata), the weighted data is written into it.
+# Return: weighted data (numpy array, or out), valid (numpy boolean array, only checked if weighting is not None otherwise all True)
+def decode(fifodata, weighting, bipolar, printBinary=False, out=None):
+    fifodata = np.asarray(fifodata, dtype=np.uint32)
+    if weighting is None:
+        # Do nothing
+        if out is None:
+            return fifodata, np.ones(fifodata.shape, dtype=bool)
+        out[:] = fifodata
+        return out, np.ones(fifodata.shape, dtype=bool)
+    # Valid bit is the MSB
+    valid = (fifodata >= 32768)
+    if printBinary:
+        for row in bitMatrix(fifodata):
+            print(row.tolist())
+    # Apply custom bit weighting.  Only the lower 16 bits of each word index the table.
+    lut = lookupTable(tuple(np.asarray(weighting).tolist()), bool(bipolar))
+    if out is None:
+        return np.take(lut, fifodata, mode='wrap'), valid
+    if out.dtype == lut.dtype:
+        np.take(lut, fifodata, mode='wrap', out=out)
+    else:
+        out[:] = np.take(lut, fifodata, mode='wrap')
+    return out, valid
+
+# Worker of the 'shm' executor.  Decodes words [start, stop) of a shared memory block into another shared memory block.
+# Input: wordsName, resultName (shared memory block names), length (total number of words), dtype (string, numpy dtype of the result), start, stop, weighting, bipolar
+def decodeShared(wordsName, resultName, length, dtype, start, stop, weighting, bipolar):
+    from multiprocessing import shared_memory
+    words = shared_memory.SharedMemory(name=wordsName)
+    result = shared_memory.SharedMemory(name=resultName)
+    try:
+        fifodata = np.ndarray(length, dtype=np.uint32, buffer=words.buf)
+        out = np.ndarray(length, dtype=np.dtype(dtype), buffer=result.buf)
+        decode(fifodata[start:stop], weighting, bipolar, out=out[start:stop])
+        del fifodata, out
+    finally:
+        words.close()
+        result.close()
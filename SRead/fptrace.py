@@ -0,0 +1,274 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/fptrace.py
+
+Record and replay of FrontPanel sessions.
+
+recorder wraps a FrontPanel backend (ok.FrontPanel or simulator.simulator), forwards every call used by fpga.py and logs it with its payload to a binary trace.
+replayer serves a trace back through the same API, at full speed or at the recorded timing, so takeData, calibration loops, and analysis scripts can be
+profiled offline against real silicon data.
+
+Usage:
+    xem = fptrace.recorder(ok.FrontPanel(), "session.trc")
+    fpga = fpga.fpga(xem=xem)
+    ...
+    xem.close()
+and later:
+    fpga = fpga.fpga(xem=fptrace.replayer("session.trc"))
+The replaying script must issue the same sequence of calls as the recorded one; any divergence raises ValueError.  Device setup calls (OpenBySerial,
+ConfigureFPGA, IsFrontPanelEnabled) are the exception: they are matched when present and otherwise skipped.
+
+Slow-control SPI traffic is not part of the trace.  The replayer offers query() as an SPI port that behaves like the CryoSAR1 shift register,
+so calibration.calibration and slowcontrol.slowcontrol program and verify against it without opening the FTDI device.
+
+Trace format: the 8 byte header TRACE_MAGIC, then one record per call:
+    float64 time (seconds since the start of the recording), uint8 opcode, uint32 endpoint address, int64 value, uint32 payload length, payload bytes
+All little-endian.
+'''
+
+import time
+import struct
+import threading
+import numpy as np
+
+TRACE_MAGIC = b"CSFPTRC1"
+RECORD = struct.Struct("<dBIqI")
+MASK = struct.Struct("<I")
+## Opcodes
+OP_OPEN = 1                 # payload: serial number
+OP_CONFIGURE = 2            # payload: bitfile name, value: return code
+OP_SETWIREIN = 3            # addr, value: wire value, payload: mask as uint32
+OP_UPDATEWIREINS = 4
+OP_UPDATEWIREOUTS = 5
+OP_GETWIREOUT = 6           # addr, value: returned wire value
+OP_PIPEOUT = 7              # addr, value: return code, payload: data read
+OP_BLOCKPIPEOUT = 8         # addr, value: return code, payload: data read
+OP_REGISTERS = 9            # payload: register data as uint32
+OP_ISFRONTPANELENABLED = 10 # value: returned boolean
+OP_NAMES = {OP_OPEN: "OpenBySerial", OP_CONFIGURE: "ConfigureFPGA", OP_SETWIREIN: "SetWireInValue", OP_UPDATEWIREINS: "UpdateWireIns",
+            OP_UPDATEWIREOUTS: "UpdateWireOuts", OP_GETWIREOUT: "GetWireOutValue", OP_PIPEOUT: "ReadFromPipeOut", OP_BLOCKPIPEOUT: "ReadFromBlockPipeOut",
+            OP_REGISTERS: "ReadRegisters", OP_ISFRONTPANELENABLED: "IsFrontPanelEnabled"}
+# Device setup calls.  Whether fpga.configure() programs the device depends on local state, so these may be missing from, or extra in, a replay.
+OP_SETUP = (OP_OPEN, OP_CONFIGURE, OP_ISFRONTPANELENABLED)
+
+
+class recorder:
+    # Input: xem (FrontPanel backend to forward calls to), path (trace file to write)
+    def __init__(self, xem, path):
+        self.xem = xem
+        self.file = open(path, "wb")
+        self.file.write(TRACE_MAGIC)
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    # Calls not recorded are forwarded as is
+    def __getattr__(self, name):
+        return getattr(self.xem, name)
+
+    # Writes one record
+    def log(self, opcode, addr=0, value=0, payload=b""):
+        with self.lock:
+            self.file.write(RECORD.pack(time.perf_counter()-self.start, opcode, addr, value, len(payload)))
+            self.file.write(payload)
+
+    def OpenBySerial(self, serial=""):
+        ret = self.xem.OpenBySerial(serial)
+        self.log(OP_OPEN, payload=serial.encode())
+        return ret
+
+    def ConfigureFPGA(self, strFilename):
+        ret = self.xem.ConfigureFPGA(strFilename)
+        self.log(OP_CONFIGURE, value=int(ret), payload=strFilename.encode())
+        return ret
+
+    def IsFrontPanelEnabled(self):
+        ret = self.xem.IsFrontPanelEnabled()
+        self.log(OP_ISFRONTPANELENABLED, value=int(bool(ret)))
+        return ret
+
+    def SetWireInValue(self, epAddr, val, mask=0xffffffff):
+        ret = self.xem.SetWireInValue(epAddr, val, mask)
+        self.log(OP_SETWIREIN, epAddr, val, MASK.pack(mask))
+        return ret
+
+    def UpdateWireIns(self):
+        ret = self.xem.UpdateWireIns()
+        self.log(OP_UPDATEWIREINS)
+        return ret
+
+    def UpdateWireOuts(self):
+        ret = self.xem.UpdateWireOuts()
+        self.log(OP_UPDATEWIREOUTS)
+        return ret
+
+    def GetWireOutValue(self, epAddr):
+        ret = self.xem.GetWireOutValue(epAddr)
+        self.log(OP_GETWIREOUT, epAddr, ret)
+        return ret
+
+    def ReadFromPipeOut(self, epAddr, data):
+        ret = self.xem.ReadFromPipeOut(epAddr, data)
+        self.log(OP_PIPEOUT, epAddr, ret, bytes(data))
+        return ret
+
+    def ReadFromPipeOutThr(self, epAddr, data):
+        ret = self.xem.ReadFromPipeOutThr(epAddr, data)
+        self.log(OP_PIPEOUT, epAddr, ret, bytes(data))
+        return ret
+
+    def ReadFromBlockPipeOut(self, epAddr, blockSize, data):
+        ret = self.xem.ReadFromBlockPipeOut(epAddr, blockSize, data)
+        self.log(OP_BLOCKPIPEOUT, epAddr, ret, bytes(data))
+        return ret
+
+    def ReadFromBlockPipeOutThr(self, epAddr, blockSize, data):
+        ret = self.xem.ReadFromBlockPipeOutThr(epAddr, blockSize, data)
+        self.log(OP_BLOCKPIPEOUT, epAddr, ret, bytes(data))
+        return ret
+
+    def ReadRegisters(self, regs):
+        ret = self.xem.ReadRegisters(regs)
+        payload = np.fromiter((i.data for i in regs), dtype='<u4', count=len(regs)).tobytes()
+        self.log(OP_REGISTERS, value=int(ret), payload=payload)
+        return ret
+
+
+class replayer:
+    virtual = True      # Not a physical device, see fpga.configure()
+
+    # Input: path (trace file), realtime (boolean, wait so that each call returns no earlier than it did in the recording), strict (boolean, also check wire-in values)
+    def __init__(self, path, realtime=False, strict=True):
+        with open(path, "rb") as f:
+            self.trace = memoryview(f.read())
+        if bytes(self.trace[0:len(TRACE_MAGIC)]) != TRACE_MAGIC:
+            raise ValueError("Not a FrontPanel trace: "+path)
+        self.ptr = len(TRACE_MAGIC)
+        self.realtime = realtime
+        self.strict = strict
+        self.lock = threading.Lock()
+        self.start = None
+        self.shiftRegister = None   # Contents of the emulated slow-control shift register
+
+    # Number of bytes of trace left to replay
+    def remaining(self):
+        return len(self.trace) - self.ptr
+
+    # Pops the next record and checks that it matches the call being made
+    # Return: addr, value, payload (memoryview), or None for a setup call missing from the trace
+    def next(self, opcode, addr=None):
+        with self.lock:
+            while True:
+                if self.ptr >= len(self.trace):
+                    if opcode in OP_SETUP:
+                        return None
+                    raise ValueError("Replay diverged: "+OP_NAMES[opcode]+" called after the end of the trace.")
+                t, op, recAddr, value, length = RECORD.unpack_from(self.trace, self.ptr)
+                if (op == opcode) or ((op not in OP_SETUP) and (opcode not in OP_SETUP)):
+                    break
+                if opcode in OP_SETUP:
+                    # Setup call not in the trace
+                    return None
+                # Setup call in the trace not made by the replaying script
+                self.ptr = self.ptr + RECORD.size + length
+            if (op != opcode) or ((addr is not None) and (addr != recAddr)):
+                raise ValueError("Replay diverged: "+OP_NAMES[opcode]+"("+("" if addr is None else hex(addr))+") called, trace has "+OP_NAMES.get(op, str(op))+"("+hex(recAddr)+").")
+            start = self.ptr + RECORD.size
+            self.ptr = start + length
+            if self.start is None:
+                self.start = time.perf_counter() - t
+        if self.realtime:
+            delay = self.start + t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return recAddr, value, self.trace[start:start+length]
+
+    def OpenBySerial(self, serial=""):
+        self.next(OP_OPEN)
+        return 0
+
+    def ConfigureFPGA(self, strFilename):
+        record = self.next(OP_CONFIGURE)
+        if record is None:
+            return 0
+        return record[1]
+
+    def IsFrontPanelEnabled(self):
+        record = self.next(OP_ISFRONTPANELENABLED)
+        if record is None:
+            return True
+        return bool(record[1])
+
+    def GetSerialNumber(self):
+        return "REPLAY"
+
+    def Close(self):
+        pass
+
+    def SetWireInValue(self, epAddr, val, mask=0xffffffff):
+        addr, value, payload = self.next(OP_SETWIREIN, epAddr)
+        if self.strict and ((value != val) or (MASK.unpack(payload)[0] != mask)):
+            raise ValueError("Replay diverged: SetWireInValue("+hex(epAddr)+", "+hex(val)+") called, trace has value "+hex(value)+".")
+        return 0
+
+    def UpdateWireIns(self):
+        self.next(OP_UPDATEWIREINS)
+        return 0
+
+    def UpdateWireOuts(self):
+        self.next(OP_UPDATEWIREOUTS)
+        return 0
+
+    def GetWireOutValue(self, epAddr):
+        return self.next(OP_GETWIREOUT, epAddr)[1]
+
+    def ReadFromPipeOut(self, epAddr, data):
+        addr, ret, payload = self.next(OP_PIPEOUT, epAddr)
+        if len(payload) != len(data):
+            raise ValueError("Replay diverged: ReadFromPipeOut of "+str(len(data))+" bytes, trace has "+str(len(payload))+" bytes.")
+        data[:] = payload
+        return ret
+
+    def ReadFromBlockPipeOut(self, epAddr, blockSize, data):
+        addr, ret, payload = self.next(OP_BLOCKPIPEOUT, epAddr)
+        if len(payload) != len(data):
+            raise ValueError("Replay diverged: ReadFromBlockPipeOut of "+str(len(data))+" bytes, trace has "+str(len(payload))+" bytes.")
+        data[:] = payload
+        return ret
+
+    ReadFromPipeOutThr = ReadFromPipeOut
+    ReadFromBlockPipeOutThr = ReadFromBlockPipeOut
+
+    def ReadRegisters(self, regs):
+        addr, ret, payload = self.next(OP_REGISTERS)
+        words = np.frombuffer(payload, dtype='<u4')
+        if len(words) != len(regs):
+            raise ValueError("Replay diverged: ReadRegisters of "+str(len(regs))+" entries, trace has "+str(len(words))+".")
+        for entry, word in zip(regs, words.tolist()):
+            entry.data = word
+        return ret
+
+    ## Slow-control API
+
+    # Full-duplex SPI transaction, same as ftdispi.query.  The shift register returns its previous contents.
+    # Input: string of bits to write, MSB first
+    # Output: string of bits read out
+    def query(self, inStr):
+        if self.shiftRegister is None:
+            self.shiftRegister = "0"*len(inStr)
+        outStr = self.shiftRegister[-len(inStr):].rjust(len(inStr), "0")
+        self.shiftRegister = (self.shiftRegister + inStr)[-len(self.shiftRegister):]
+        return outStr
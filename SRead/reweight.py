@@ -0,0 +1,98 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/reweight.py
+
+Offline re-weighting of archived raw FIFO words.  Applies a batch of K candidate weight vectors to N stored words in one pass, without re-running the hardware capture.
+Use this to sweep weight perturbations or compare calibrations on the same data.
+'''
+
+import sys
+import argparse
+import numpy as np
+import archive
+from fpga import bitMatrix
+from plotFFT import plotFFT
+from calcINLDNL import calcINLDNL
+
+
+# Lookup tables of the weighted output of every possible 16-bit FIFO word, one row per weight vector
+# Input: weights (K x 16 array-like, each row from MSB to LSB), bipolar (boolean)
+# Return: K x 65536 numpy array
+def lookupTables(weights, bipolar=False):
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    return weights @ bitMatrix(np.arange(65536, dtype=np.uint32), bipolar).T
+
+# Applies K weight vectors to N FIFO words
+# Input: words (N FIFO words, e.g. archive.words()), weights (K x 16 array-like, or a single list of 16), bipolar (boolean), out (optional K x N numpy array of floats)
+# Return: K x N numpy array.  Row k is the data weighted with weights[k].
+def reweight(words, weights, bipolar=False, out=None):
+    luts = lookupTables(weights, bipolar)
+    words = np.asarray(words)
+    if out is None:
+        out = np.empty((luts.shape[0], len(words)))
+    # Only the lower 16 bits of each word index the tables
+    np.take(luts, words, axis=1, mode='wrap', out=out)
+    return out
+
+# Generates randomly perturbed copies of a weight vector
+# Input: weights (list of 16), K (number of vectors), sigma (relative standard deviation of the perturbation), seed (random seed or None)
+# Return: K x 16 numpy array.  Row 0 is the unperturbed weight vector.  Weights of zero stay zero.
+def perturb(weights, K, sigma, seed=None):
+    rng = np.random.default_rng(seed)
+    weights = np.asarray(weights, dtype=float)
+    candidates = weights*(1 + sigma*rng.standard_normal((K, len(weights))))
+    candidates[0] = weights
+    return candidates
+
+# Applies K weight vectors to the words of an archive
+# Input: arc (archive), weights (K x 16, or None to use the archived weights), bipolar (boolean, or None to use the archived setting)
+# Return: K x N numpy array
+def reweightArchive(arc, weights=None, bipolar=None):
+    if weights is None:
+        weights = arc.metadata["weights"]
+    if bipolar is None:
+        bipolar = arc.metadata["bipolar"]
+    return reweight(arc.words(), weights, bipolar)
+
+# FFT metrics of each row of a re-weighted result
+# Input: results (K x N), fs (sampling frequency in Hz), additional keyword arguments are passed to plotFFT
+# Return: K x 5 numpy array of ENOB, SNDR, SFDR, SNR, SDR
+def sweepFFT(results, fs, **kwargs):
+    metrics = np.empty((len(results), 5))
+    for k, row in enumerate(results):
+        metrics[k] = plotFFT(row, fs, plot=False, **kwargs)[0:5]
+    return metrics
+
+# INL/DNL of each row of a re-weighted result
+# Input: results (K x N, in LSB)
+# Return: K x 2 numpy array of peak |DNL| and peak |INL|, and the list of (codes, DNL, INL, hist) per row from calcINLDNL
+def sweepINLDNL(results):
+    curves = [calcINLDNL(row) for row in results]
+    peaks = np.array([[np.max(np.abs(dnl)), np.max(np.abs(inl))] for codes, dnl, inl, hist in curves])
+    return peaks, curves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweeps random weight perturbations over an archived capture and reports FFT metrics.')
+    parser.add_argument('path', help="Archive base path (without extension)")
+    parser.add_argument('-k', dest='K', type=int, default=16, help="Number of weight vectors, including the archived one.  (Default: 16)")
+    parser.add_argument('-s', dest='sigma', type=float, default=0.002, help="Relative standard deviation of the perturbation.  (Default: 0.002)")
+    parser.add_argument('--fs', dest='fs', type=float, default=92000000/8, help="Sampling frequency in Hz.  (Default: 11.5 MHz)")
+    parser.add_argument('--seed', dest='seed', type=int, default=None, help="Random seed")
+    args = parser.parse_args()
+
+    arc = archive.archive(args.path)
+    if arc.metadata["weights"] is None:
+        sys.exit("Archive does not record weights.")
+    candidates = perturb(arc.metadata["weights"], args.K, args.sigma, args.seed)
+    results = reweightArchive(arc, candidates)
+    metrics = sweepFFT(results, args.fs)
+    order = np.argsort(-metrics[:, 0])
+    print("Rank  Vector  ENOB    SNDR    SFDR")
+    for rank, k in enumerate(order):
+        print("%4i  %6i  %6.3f  %6.2f  %6.2f" % (rank, k, metrics[k, 0], metrics[k, 1], metrics[k, 2]))
+    print("Best weights (vector "+str(order[0])+"):")
+    print("["+', '.join([f'{item:.8f}' for item in candidates[order[0]]])+"]")
@@ -0,0 +1,252 @@
+#!/bin/python3
+# Python 3.6 or greater
+'''
+Ray Xu
+Oct 2026
+cryosar1/SRead/simulator.py
+
+Behavioral CryoSAR1 simulator.  Stands in for the XEM FrontPanel device (ok.FrontPanel) and for the slow-control SPI port (ftdispi) so that the
+acquisition, calibration, and analysis code can be run and benchmarked without hardware.
+
+Model:
+ - 15 SAR slices, MSB to LSB, with configurable true weights for the P-DAC and N-DAC, and gaussian comparator noise on every decision
+ - Offset: a fixed input-referred offset plus the offset DAC, ODAC_CODE (offset binary, ODAC_LSB per code).  B_SEL inverts the sign of the whole offset.
+ - Normal conversion (CAL_EN = 0): the input is a sine wave or DC level; slices are enabled by SLICE_EN_P and SLICE_EN_N
+ - Calibration (CAL_EN = 1): the input is disconnected; B_SEL picks the P-DAC (0) or N-DAC (1); slices in CAL_FORCE_* are forced to CAL_DIR_* and
+   move the residue by their weight; other slices are enabled by SLICE_EN_*
+ - FIFO: fills at SER_RATE/SER_WIDTH samples per second after a start command (or instantly if realtime is False), FIFO_DEPTH words deep.
+   Words read beyond the fill level are zero, so their valid bit is cleared.
+'''
+
+import os
+import time
+import configparser
+import numpy as np
+
+class simulator:
+    ## Constants mirroring the firmware (see fpga.py)
+    ADDR_WIRE = 0x00
+    ADDR_FIFOSTATUS = 0x20
+    MASK_FIFO_FULL = 0x00010000
+    CMD_RESET = {0x00000005: "fpgacounter", 0x00000003: "data", 0x00000001: "frame"}
+    CMD_START = {0x00000004: "fpgacounter", 0x00000002: "data", 0x00000000: "frame"}
+    FIFO_DEPTH = 32771
+    SER_RATE = 92000000
+    SER_WIDTH = 8
+    FRAME_WORD = 0x9c           # Frame pattern
+    BATCH_GAP = 1000            # Samples skipped between captures, to keep the sine phase moving
+    ## Defaults of the analog model
+    DEF_WEIGHTS = [0.0, 2006.09454297, 1148.97427933, 658.85001317, 377.08327815, 215.22337779, 124.57091282, 73.45937688, 41.22472722, 24.80801392, 14.38511658, 7.81584167, 5.0, 3.0, 2.0, 1.0]   # Measured silicon, 12bRC arrangement
+    ODAC_LSB = 2.0              # Offset DAC step, in LSB
+    DEF_FREQUENCY = 2861*(SER_RATE/SER_WIDTH)/32768     # Coherent with a 32768 sample capture (prime number of cycles), about 1 MHz
+    DEF_CFGFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SControl", "config", "CryoSAR1.cfg")
+
+    # Inputs:
+    # weights (list of 16 true weights from MSB to LSB, first element is the valid bit and ignored), weightsN (same for the N-DAC, or None to use weights)
+    # noise (comparator noise, standard deviation in LSB), offset (input-referred offset in LSB at ODAC_CODE = 10000000)
+    # signal ("sine" or "dc"), amplitude (LSB), frequency (Hz), dc (LSB)
+    # realtime (boolean, fill the FIFO at the real sample rate), seed (random seed), cfgFile (slow-control configuration file giving the field layout and power-on values)
+    def __init__(self, weights=DEF_WEIGHTS, weightsN=None, noise=0.5, offset=-10.6, signal="sine", amplitude=2000.0, frequency=DEF_FREQUENCY, dc=0.0, realtime=True, seed=None, cfgFile=DEF_CFGFILE):
+        self.weightsP = np.asarray(weights, dtype=float)
+        if weightsN is None:
+            self.weightsN = self.weightsP
+        else:
+            self.weightsN = np.asarray(weightsN, dtype=float)
+        self.noise = noise
+        self.offset = offset
+        if signal not in ("sine", "dc"):
+            raise ValueError("Invalid signal.")
+        self.signal = signal
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.dc = dc
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        # Slow-control field layout, MSB first
+        cfg = configparser.ConfigParser()
+        cfg.read(cfgFile)
+        self.order = cfg['Default']['order'].split(",")
+        self.widths = [int(cfg[field]['width']) for field in self.order]
+        self.defaults = {field: cfg[field]['value'] for field in self.order}
+        self.config = dict(self.defaults)
+        self.shiftRegister = "0"*sum(self.widths)
+        # FrontPanel state
+        self.wireIns = {}
+        self.wireInsPending = {}
+        self.source = None
+        self.startTime = None
+        self.readPtr = 0
+        self.sampleClock = 0        # Index of the next sample of the analog input
+        self.startSample = 0
+
+    ## FrontPanel API subset used by fpga.py
+
+    virtual = True      # Not a physical device, see fpga.configure()
+
+    def OpenBySerial(self, serial=""):
+        return 0
+
+    def ConfigureFPGA(self, strFilename):
+        return 0
+
+    def IsFrontPanelEnabled(self):
+        return True
+
+    def GetSerialNumber(self):
+        return "SIMULATOR"
+
+    def Close(self):
+        pass
+
+    def SetWireInValue(self, epAddr, val, mask=0xffffffff):
+        old = self.wireInsPending.get(epAddr, self.wireIns.get(epAddr, 0))
+        self.wireInsPending[epAddr] = (old & ~mask) | (val & mask)
+        return 0
+
+    def UpdateWireIns(self):
+        self.wireIns.update(self.wireInsPending)
+        self.wireInsPending = {}
+        command = self.wireIns.get(self.ADDR_WIRE)
+        if command in self.CMD_RESET:
+            # Reset: FIFO cleared and stopped
+            self.source = None
+            self.startTime = None
+            self.readPtr = 0
+        elif (command in self.CMD_START) and (self.startTime is None):
+            self.source = self.CMD_START[command]
+            self.startTime = time.perf_counter()
+            self.readPtr = 0
+            self.startSample = self.sampleClock
+        return 0
+
+    def UpdateWireOuts(self):
+        return 0
+
+    def GetWireOutValue(self, epAddr):
+        if epAddr == self.ADDR_FIFOSTATUS:
+            filled = self.filled()
+            status = filled - self.readPtr
+            if filled == self.FIFO_DEPTH:
+                status = status | self.MASK_FIFO_FULL
+            return status
+        return 0
+
+    def ReadFromPipeOut(self, epAddr, data):
+        words = self.read(len(data)//4)
+        data[:] = words.astype('<u4').tobytes()
+        return len(data)
+
+    def ReadFromBlockPipeOut(self, epAddr, blockSize, data):
+        return self.ReadFromPipeOut(epAddr, data)
+
+    ReadFromPipeOutThr = ReadFromPipeOut
+    ReadFromBlockPipeOutThr = ReadFromBlockPipeOut
+
+    def ReadRegisters(self, regs):
+        words = self.read(len(regs))
+        for entry, word in zip(regs, words.tolist()):
+            entry.data = word
+        return 0
+
+    ## Slow-control API
+
+    # Full-duplex SPI transaction, same as ftdispi.query.  The shift register returns its previous contents.
+    # Input: string of bits to write, MSB first
+    # Output: string of bits read out
+    def query(self, inStr):
+        outStr = self.shiftRegister[-len(inStr):].rjust(len(inStr), "0")
+        self.shiftRegister = (self.shiftRegister + inStr)[-len(self.shiftRegister):]
+        # Latch the configuration
+        ptr = 0
+        for field, width in zip(self.order, self.widths):
+            self.config[field] = self.shiftRegister[ptr:ptr+width]
+            ptr = ptr + width
+        return outStr
+
+    # Applies overrides on top of the power-on configuration, same as 'SControl.py -b -o ...'
+    # Input: list of '<field name>,<value>' strings
+    def applyOverrides(self, overrides):
+        self.config = dict(self.defaults)
+        for o in overrides:
+            field, value = o.split(",")[0:2]
+            width = self.widths[self.order.index(field)]
+            self.config[field] = value.rjust(width, "0")[-width:]
+        self.shiftRegister = "".join([self.config[field] for field in self.order])
+
+    ## Model
+
+    # Number of words written into the FIFO since the last start command
+    def filled(self):
+        if self.startTime is None:
+            return 0
+        if not self.realtime:
+            return self.FIFO_DEPTH
+        elapsed = time.perf_counter() - self.startTime
+        return int(min(self.FIFO_DEPTH, elapsed*self.SER_RATE/self.SER_WIDTH))
+
+    # Reads words out of the FIFO
+    # Input: n (number of words)
+    # Output: numpy array of uint32 words
+    def read(self, n):
+        words = np.zeros(n, dtype=np.uint32)
+        available = max(0, min(n, self.filled() - self.readPtr))
+        first = self.startSample + self.readPtr
+        if available > 0:
+            if self.source == "data":
+                words[:available] = self.convert(np.arange(first, first+available))
+            elif self.source == "frame":
+                words[:available] = self.FRAME_WORD
+            elif self.source == "fpgacounter":
+                words[:available] = (np.arange(first, first+available)*self.SER_WIDTH) & 0xFFFF
+        self.readPtr = self.readPtr + available
+        self.sampleClock = self.startSample + self.readPtr + self.BATCH_GAP
+        return words
+
+    # Field of the current configuration as a list of integer bits, MSB first
+    def bits(self, field):
+        return np.array([int(b) for b in self.config[field]], dtype=bool)
+
+    # Runs the SAR conversion of the given samples
+    # Input: samples (numpy array of sample indices)
+    # Output: numpy array of uint32 FIFO words with the valid bit set
+    def convert(self, samples):
+        calEn = self.config["CAL_EN"] == "1"
+        bsel = self.config["B_SEL"] == "1"
+        odac = int(self.config["ODAC_CODE"], 2) - 2**(len(self.config["ODAC_CODE"])-1)
+        offset = self.offset + odac*self.ODAC_LSB
+        if bsel:
+            offset = -offset
+        n = len(samples)
+        if calEn:
+            # Input disconnected, one DAC manipulated
+            if bsel:
+                weights, enable, force, direction = self.weightsN, self.bits("SLICE_EN_N"), self.bits("CAL_FORCE_N"), self.config["CAL_DIR_N"] == "1"
+            else:
+                weights, enable, force, direction = self.weightsP, self.bits("SLICE_EN_P"), self.bits("CAL_FORCE_P"), self.config["CAL_DIR_P"] == "1"
+            residue = np.full(n, offset)
+        else:
+            weights = (self.weightsP + self.weightsN)/2
+            enable = self.bits("SLICE_EN_P") & self.bits("SLICE_EN_N")
+            force = np.zeros(15, dtype=bool)
+            direction = False
+            t = samples/(self.SER_RATE/self.SER_WIDTH)
+            if self.signal == "sine":
+                residue = self.dc + self.amplitude*np.sin(2*np.pi*self.frequency*t) + offset
+            else:
+                residue = np.full(n, self.dc + offset)
+        words = np.full(n, 0x8000, dtype=np.uint32)
+        for j in range(15):
+            shift = 14 - j
+            w = weights[j+1]
+            if force[j]:
+                # Forced slice: output follows the calibration direction, residue moves by the slice weight
+                if direction:
+                    words = words | (1 << shift)
+                    residue = residue + w
+                else:
+                    residue = residue - w
+            elif enable[j]:
+                decision = (residue + self.noise*self.rng.standard_normal(n)) > 0
+                words = words | (decision.astype(np.uint32) << shift)
+                residue = residue - np.where(decision, w, -w)
+        return words
@@ -14,12 +14,15 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 from bitstring import BitArray
+import sys
+sys.path.append("./../SRead")
+import fpga
 
 if __name__ == "__main__":
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
     #xem.LoadDefaultPLLConfiguration()
-    xem.ConfigureFPGA('RBBRAM_FRAME.bit')
+    fpga.configureBitfile(xem, 'RBBRAM_FRAME.bit')
 
     # Reset
     xem.SetWireInValue(0x00, 0x00000001)
@@ -14,12 +14,15 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 from bitstring import BitArray
+import sys
+sys.path.append("./../SRead")
+import fpga
 
 if __name__ == "__main__":
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
     #xem.LoadDefaultPLLConfiguration()
-    xem.ConfigureFPGA('RBFIFO.bit')
+    fpga.configureBitfile(xem, 'RBFIFO.bit')
 
 
     # Reset, mode 1
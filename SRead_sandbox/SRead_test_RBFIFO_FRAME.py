@@ -17,6 +17,8 @@ import numpy as np
 import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from PyQt5 import QtWidgets, QtCore, QtGui #pyqt stuff
 from bitstring import BitArray
+sys.path.append("./../SRead")
+import fpga
 
 if __name__ == "__main__":
     QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True) #enable highdpi scaling
@@ -27,7 +29,7 @@ if __name__ == "__main__":
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
     #xem.LoadDefaultPLLConfiguration()
-    xem.ConfigureFPGA('RBFIFO_FRAME.bit')
+    fpga.configureBitfile(xem, 'RBFIFO_FRAME.bit')
 
 
     # Reset, testmode
@@ -14,7 +14,6 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 import numpy as np
-import subprocess
 import tabulate
 import time
 import sys
@@ -22,6 +21,10 @@ import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
+sys.path.append("./../SControl")
+import slowcontrol
+sys.path.append("./../SRead")
+import fpga
 
 
 
@@ -45,7 +48,9 @@ if __name__ == "__main__":
     # Initialize FPGA
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
-    xem.ConfigureFPGA('cryosar1_FPGARTL.bit')
+    fpga.configureBitfile(xem, 'cryosar1_FPGARTL.bit')
+    # Initialize slow-control
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
     
     # Initialize test vectors
     odac_list = ["00000000", "00010000", "1110000", "10000000", "10010000", "11101111", "11111111"]
@@ -54,11 +59,7 @@ if __name__ == "__main__":
         # Set BSEL = 0 (CMP_N)
         # Load configuration for chip
         try:
-            subprocess.run(["./../SControl/SControl.py", 
-                "-b",
-                "-o", "ODAC_CODE,"+odac,
-                "-o", "B_SEL,0",
-                "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+            sc.apply(["ODAC_CODE,"+odac, "B_SEL,0"])
         except Exception as e:
             sys.exit(e)
         # Read from FPGA
@@ -97,11 +98,7 @@ if __name__ == "__main__":
         # Set BSEL = 1 (CMP_P)
         # Load configuration for chip
         try:
-            subprocess.run(["./../SControl/SControl.py", 
-                "-b",
-                "-o", "ODAC_CODE,"+odac,
-                "-o", "B_SEL,1",
-                "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+            sc.apply(["ODAC_CODE,"+odac, "B_SEL,1"])
         except Exception as e:
             sys.exit(e)
         # Read from FPGA
@@ -14,10 +14,13 @@ The path to libokFrontPanel.so must be exported as an environment variable to $L
 import ok
 import time
 import numpy as np
-import subprocess
 import timeit
 import sys
 from bitstring import BitArray
+sys.path.append("./../SControl")
+import slowcontrol
+sys.path.append("./../SRead")
+import fpga
 
 
 
@@ -32,6 +35,8 @@ if __name__ == "__main__":
     DATA_FRAME_RESET = 0x00000001
     DATA_FRAME_START = 0x00000000
     FIFO_DEPTH = 32768
+    ADDR_PIPEOUT = 0xA0         # Pipe-out endpoint draining the same FIFO as the register bridge
+    PIPE_BLOCKSIZE = 1024       # Block size in bytes for block-pipe transfers
     SER_RATE = 20000000    # Serialization speed, in MHz
     SER_WIDTH = 8               # Number of bits serialized in one sampling period
     WAIT_FOR_DATA = (FIFO_DEPTH*1.2)/(SER_RATE/SER_WIDTH)  # Expression to wait for the FIFO to fill + 20% margin
@@ -40,14 +45,13 @@ if __name__ == "__main__":
     # Initialize FPGA
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
-    xem.ConfigureFPGA('cryosar1_FPGARTL.bit')
+    fpga.configureBitfile(xem, 'cryosar1_FPGARTL.bit')
+    # Initialize slow-control
+    sc = slowcontrol.slowcontrol("./../SControl/config/CryoSAR1.cfg")
 
     # Load configuration for chip, serializer test mode
     try:
-        subprocess.run(["./../SControl/SControl.py", 
-            "-b",
-            "-o", "TX_TESTMODE,1",
-            "-f", "./../SControl/config/CryoSAR1.cfg"], check=True)
+        sc.apply(["TX_TESTMODE,1"])
     except Exception as e:
         sys.exit(e)
 
@@ -111,6 +115,39 @@ if __name__ == "__main__":
             print("Saw unique value difference: decimal "+str(i))
         print("Transferred "+str(FIFO_DEPTH+add)+" double-words in %0.3f seconds: %0.3f double-words/second." % (benchmark, (FIFO_DEPTH+add)/benchmark))
 
+    #### TEST 4: Transfer throughput, register bridge versus pipe-out ####
+    print("==== TEST 4: Transfer throughput ====")
+    print("Compares the register bridge (one SWIG object per double-word) against pipe-out transfers into a preallocated buffer.")
+    print("The FPGA counter is used as the data source.  For a serialization factor of 8, the discrete differences should only be 8 and -65528.")
+    buf = bytearray(FIFO_DEPTH*4)      # Preallocated once, reused by every pipe transfer
+    for mode in ["register", "pipe", "blockpipe"]:
+        xem.SetWireInValue(ADDR_WIRE, DATA_FPGACOUNTER_RESET)
+        xem.UpdateWireIns()
+        time.sleep(0.1)
+        xem.SetWireInValue(ADDR_WIRE, DATA_FPGACOUNTER_START)
+        xem.UpdateWireIns()
+        time.sleep(WAIT_FOR_DATA)
+        # Transfer data, including conversion to a numpy array
+        start = time.perf_counter()
+        if mode == "register":
+            data = ok.okTRegisterEntries(FIFO_DEPTH)
+            xem.ReadRegisters(data)
+            data = np.fromiter((i.data for i in data), dtype=np.uint32, count=FIFO_DEPTH)
+        elif mode == "pipe":
+            ret = xem.ReadFromPipeOut(ADDR_PIPEOUT, buf)
+            data = np.frombuffer(buf, dtype='<u4')
+        else:
+            ret = xem.ReadFromBlockPipeOut(ADDR_PIPEOUT, PIPE_BLOCKSIZE, buf)
+            data = np.frombuffer(buf, dtype='<u4')
+        benchmark = time.perf_counter() - start
+        if (mode != "register") and (ret < 0):
+            print("Mode "+mode+": transfer failed with FrontPanel error code "+str(ret)+".  Does the firmware expose the pipe-out endpoint?")
+            continue
+        data_unique = np.unique(np.diff(data.astype(np.int64)))
+        for i in data_unique:
+            print("Saw unique value difference: decimal "+str(i))
+        print("Mode "+mode+": transferred "+str(FIFO_DEPTH)+" double-words in %0.3f seconds: %0.3f double-words/second." % (benchmark, (FIFO_DEPTH)/benchmark))
+
     
 
 
@@ -22,6 +22,8 @@ import pandas as pd
 import matplotlib as mpl
 import matplotlib.pyplot as plt     # DNF: python3-matplotlib
 from bitstring import BitArray
+sys.path.append("./../SRead")
+import fpga
 
 
 
@@ -46,7 +48,7 @@ if __name__ == "__main__":
     # Initialize FPGA
     xem = ok.FrontPanel()
     xem.OpenBySerial("")
-    xem.ConfigureFPGA('cryosar1_FPGARTL.bit')
+    fpga.configureBitfile(xem, 'cryosar1_FPGARTL.bit')
     
     
     # Read from FPGA